@@ -0,0 +1,132 @@
+import numpy as np
+
+
+def longest_run(mask):
+    """Return the length of the longest run of True values along the last axis of `mask`.
+
+    :param mask:                        boolean array of shape (..., tSteps + 1)
+
+    :return:                            integer array of shape (...)
+
+    """
+    mask = np.asarray(mask, dtype=bool)
+    steps = np.arange(1, mask.shape[-1] + 1)
+
+    # position of the most recent False at or before each step
+    last_false = np.maximum.accumulate(np.where(mask, 0, steps), axis=-1)
+
+    return (steps - last_false).max(axis=-1, initial=0)
+
+
+def low_harvest_streak(harvest, prey, divisor=20):
+    """Longest run of consecutive time steps with harvest below a fraction of the prey population.
+
+    :param harvest:                     harvest array of shape (..., tSteps + 1)
+    :param prey:                        prey population array of the same shape
+    :param divisor:                     harvests below prey / divisor count as low; a division, as
+                                        in `fish_game`, so the threshold rounds identically
+
+    :return:                            array of shape (...)
+
+    """
+    return longest_run(harvest < prey / divisor)
+
+
+def discounted_npv(harvest, rate=0.05):
+    """Net present value of the harvest, discounting step t by (1 + rate) ** -t.
+
+    :param harvest:                     harvest array of shape (..., tSteps + 1)
+    :param rate:                        discount rate per time step
+
+    :return:                            array of shape (...)
+
+    """
+    harvest = np.asarray(harvest)
+    discount = np.array([(1 + rate) ** (-t) for t in range(harvest.shape[-1])])
+
+    return np.sum(harvest * discount, axis=-1)
+
+
+def harvest_percentile(harvest, q=1):
+    """Percentile of the harvest over time.
+
+    :param harvest:                     harvest array of shape (..., tSteps + 1)
+    :param q:                           percentile to compute, between 0 and 100
+
+    :return:                            array of shape (...)
+
+    """
+    return np.percentile(harvest, q, axis=-1)
+
+
+def harvest_variance(harvest):
+    """Variance of the harvest over time.
+
+    :param harvest:                     harvest array of shape (..., tSteps + 1)
+
+    :return:                            array of shape (...)
+
+    """
+    return np.var(harvest, axis=-1)
+
+
+def prey_deficit(prey, K):
+    """Mean relative shortfall of the prey population below its carrying capacity over time.
+
+    :param prey:                        prey population array of shape (..., tSteps + 1)
+    :param K:                           carrying capacity, a scalar or an array broadcasting
+                                        against shape (...)
+
+    :return:                            array of shape (...)
+
+    """
+    K = np.asarray(K)[..., None]
+
+    return np.mean((K - prey) / K, axis=-1)
+
+
+def collapse_days(predator, threshold=1):
+    """Number of time steps with the predator population below a threshold.
+
+    :param predator:                    predator population array of shape (..., tSteps + 1)
+    :param threshold:                   population below which the predator counts as collapsed
+
+    :return:                            integer array of shape (...)
+
+    """
+    return (np.asarray(predator) < threshold).sum(axis=-1)
+
+
+def fishery_objectives(prey, predator, harvest, K, rate=0.05):
+    """Compute the fish game objectives and constraint from simulated trajectories.
+
+    All statistics are computed per realization and averaged over the realization axis, so any
+    number of leading axes, e.g. SOWs or policies, are evaluated in one pass.
+
+    :param prey:                        prey population array of shape (..., N, tSteps + 1)
+    :param predator:                    predator population array of the same shape
+    :param harvest:                     harvest array of the same shape
+    :param K:                           carrying capacity, a scalar or an array broadcasting
+                                        against shape (...)
+    :param rate:                        discount rate used for the NPV
+
+    :return:                            objectives of shape (..., 5), ordered as negative mean NPV,
+                                        mean prey deficit, mean longest low-harvest streak, negative
+                                        mean 1st percentile harvest and mean harvest variance, and
+                                        the mean number of predator collapse days of shape (...)
+
+    """
+    objs = np.stack(
+        [
+            -np.mean(discounted_npv(harvest, rate), axis=-1),
+            np.mean(prey_deficit(prey, np.asarray(K)[..., None]), axis=-1),
+            np.mean(low_harvest_streak(harvest, prey), axis=-1),
+            -np.mean(harvest_percentile(harvest, 1), axis=-1),
+            np.mean(harvest_variance(harvest), axis=-1),
+        ],
+        axis=-1,
+    )
+
+    cnstr = np.mean(collapse_days(predator), axis=-1)
+
+    return objs, cnstr
@@ -1,9 +1,12 @@
+import concurrent.futures
+
 import numpy as np
-import itertools
 
 import matplotlib.pyplot as plt
 from matplotlib import patheffects as pe
 
+from msdbook.fishery_objectives import fishery_objectives
+
 
 def inequality(b, m, h, K):
 
@@ -172,7 +175,7 @@ def plot_solutions(objective_performance, profit_solution, robust_solution):
     return ax1
 
 
-def fish_game(vars, additional_inputs, N=100, tSteps=100, nObjs=5, nCnstr=1):
+def fish_game(vars, additional_inputs, N=100, tSteps=100, nObjs=5, nCnstr=1, rng=None, noise=None):
     """Define the problem to be solved.
 
     :param vars:                        contains all C, R, W
@@ -181,141 +184,367 @@ def fish_game(vars, additional_inputs, N=100, tSteps=100, nObjs=5, nCnstr=1):
     :param tSteps:                      no. of timesteps to run the fish game on
     :param nObjs:                       no. of objectives in output
     :param nCnstr:                      no. of objectives in output
+    :param rng:                         `numpy.random.Generator`, `numpy.random.SeedSequence` or
+                                        integer seed to draw the stochasticity from; defaults to
+                                        the global NumPy random state
+    :param noise:                       Optional standard normal array of shape (2, N) for prey
+                                        and predator stochasticity, scaled by sigmaX and sigmaY;
+                                        pass the same array when comparing policies to use common
+                                        random numbers
 
     """
     # Get chosen strategy
     strategy = additional_inputs[0]
 
     # Get system behavior parameters (need to convert from string to float)
-    a = float(additional_inputs[1])
-    b = float(additional_inputs[2])
-    c = float(additional_inputs[3])
-    d = float(additional_inputs[4])
-    h = float(additional_inputs[5])
-    K = float(additional_inputs[6])
-    m = float(additional_inputs[7])
-    sigmaX = float(additional_inputs[8])
-    sigmaY = float(additional_inputs[9])
-
-    x = np.zeros(tSteps + 1)  # Create prey population array
-    y = np.zeros(tSteps + 1)  # Create predator population array
-    z = np.zeros(tSteps + 1)  # Create harvest array
-
-    # Create array to store harvest for all realizations
-    harvest = np.zeros([N, tSteps + 1])
-
-    # Create array to store effort for all realizations
-    effort = np.zeros([N, tSteps + 1])
-
-    # Create array to store prey for all realizations
-    prey = np.zeros([N, tSteps + 1])
-
-    # Create array to store predator for all realizations
-    predator = np.zeros([N, tSteps + 1])
-
-    # Create array to store metrics per realization
-    NPV = np.zeros(N)
-    cons_low_harv = np.zeros(N)
-    harv_1st_pc = np.zeros(N)
-    variance = np.zeros(N)
+    sow = np.array([float(i) for i in additional_inputs[1:10]])
+    sigmaX, sigmaY = sow[7], sow[8]
 
     # Create arrays to store objectives and constraints
     objs = [0.0] * nObjs
     cnstr = [0.0] * nCnstr
 
-    # Create array with environmental stochasticity for prey
-    epsilon_prey = np.random.normal(0.0, sigmaX, N)
+    if noise is not None:
+        noise = np.asarray(noise, dtype=float)
+        if noise.shape != (2, N):
+            raise ValueError(f"`noise` must have shape {(2, N)}")
+
+        epsilon_prey = sigmaX * noise[0]
+        epsilon_predator = sigmaY * noise[1]
+    else:
+        random = np.random if rng is None else np.random.default_rng(rng)
+
+        # Create array with environmental stochasticity for prey
+        epsilon_prey = random.normal(0.0, sigmaX, N)
+
+        # Create array with environmental stochasticity for predator
+        epsilon_predator = random.normal(0.0, sigmaY, N)
+
+    sow_objs, sow_cnstr = _fish_game_objectives(
+        vars, strategy, sow[None, :], epsilon_prey[None, :], epsilon_predator[None, :], tSteps
+    )
+
+    for i in range(sow_objs.shape[1]):
+        objs[i] = sow_objs[0, i]
+
+    cnstr[0] = sow_cnstr[0]
+
+    return objs, cnstr
+
+
+# number of objectives computed by `fish_game`
+FISH_GAME_OBJECTIVES = 5
+
 
-    # Create array with environmental stochasticity for predator
-    epsilon_predator = np.random.normal(0.0, sigmaY, N)
+def _fish_game_objectives(vars, strategy, sows, epsilon_prey, epsilon_predator, tSteps):
+    """Simulate a policy for a batch of SOWs and their realizations.
 
-    # Go through N possible realizations
-    for i in range(N):
+    :param vars:                        contains all C, R, W
+    :param strategy:                    management strategy
+    :param sows:                        array of shape (n_sow, 9) with columns a, b, c, d, h, K, m,
+                                        sigmaX, sigmaY
+    :param epsilon_prey:                prey stochasticity of shape (n_sow, N)
+    :param epsilon_predator:            predator stochasticity of shape (n_sow, N)
+    :param tSteps:                      no. of timesteps to run the fish game on
 
-        # Initialize populations and values
-        x[0] = prey[i, 0] = K
-        y[0] = predator[i, 0] = 250
-        z[0] = effort[i, 0] = hrvSTR([x[0]], vars, [[0, K]], [[0, 1]])[0]
-        NPVharvest = harvest[i, 0] = effort[i, 0] * x[0]
+    :return:                            objectives of shape (n_sow, 5) and the constraint of
+                                        shape (n_sow,)
 
-        # Go through all timesteps for prey, predator, and harvest
+    """
+    # System behavior parameters as (n_sow, 1) columns broadcasting over the realizations
+    a, b, c, d, h, K, m = (sows[:, i, None] for i in range(7))
+    n_sow, N = epsilon_prey.shape
+
+    # Create arrays for prey, predator, effort and harvest indexed by [t, sow, realization]
+    prey = np.zeros([tSteps + 1, n_sow, N])
+    predator = np.zeros([tSteps + 1, n_sow, N])
+    effort = np.zeros([tSteps + 1, n_sow, N])
+    harvest = np.zeros([tSteps + 1, n_sow, N])
+
+    growth_prey = np.exp(epsilon_prey)
+    growth_predator = np.exp(epsilon_predator)
+
+    # Unpack the harvest policy once; inputs are the prey population normalized by K of each SOW
+    policy = RBFPolicy(vars, [[0, 1]], [[0, 1]])
+
+    # Initialize populations and values for all realizations
+    prey[0] = K
+    predator[0] = 250
+    effort[0] = policy([1.0])[0]
+    harvest[0] = effort[0] * prey[0]
+
+    # A collapsed realization takes the values of the previous one, so the realizations before
+    # the first live one of a SOW are zero from then on and stay collapsed.  Only the SOWs with a
+    # live realization (`rows`) from the first column any of them may still need (`first`) on are
+    # stepped; the zero-initialised arrays already hold the collapsed tails.
+    rows = slice(None)
+    first = 0
+    a_, b_, c_, d_, h_, K_, m_ = a, b, c, d, h, K, m
+    growth_prey_, growth_predator_ = growth_prey, growth_predator
+
+    # Step all SOWs and realizations forward together
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
         for t in range(tSteps):
+            x = prey[t, rows, first:]
+            y = predator[t, rows, first:]
+            z = effort[t, rows, first:]
+
+            denominator = np.power(y, m_) + a_ * h_ * x
+
+            # Prey growth equation
+            x_next = (x + b_ * x * (1 - x / K_) - (a_ * x * y) / denominator - z * x) * growth_prey_
+
+            # Predator growth equation
+            y_next = (y + c_ * a_ * x * y / denominator - d_ * y) * growth_predator_
+
+            if strategy == "Previous_Prey":
+                # Harvest effort from the prey population of the current step
+                z_next = policy((x / K_).reshape(-1, 1)).reshape(x.shape)
+            else:
+                z_next = np.zeros(x.shape)
+
+            alive = (x > 0) & (y > 0)
+            if not alive.all():
+                x_next = _carry_forward(x_next, alive)
+                y_next = _carry_forward(y_next, alive)
+                z_next = _carry_forward(z_next, alive)
+
+            prey[t + 1, rows, first:] = x_next
+            predator[t + 1, rows, first:] = y_next
+            effort[t + 1, rows, first:] = z_next
+            harvest[t + 1, rows, first:] = z_next * x_next
+
+            if alive.all():
+                continue
+
+            # Drop SOWs without live realizations and leading columns collapsed in all the others
+            live = alive.any(axis=1)
+            if not live.any():
+                break
+
+            rows = np.arange(n_sow)[rows][live]
+            first += alive[live].argmax(axis=1).min()
+            a_, b_, c_, d_, h_, K_, m_ = (i[rows] for i in (a, b, c, d, h, K, m))
+            growth_prey_ = growth_prey[rows, first:]
+            growth_predator_ = growth_predator[rows, first:]
+
+    # Put time last, as [sow, realization, t]; contiguous copies keep each SOW's reductions
+    # independent of how many SOWs are simulated together
+    prey = np.ascontiguousarray(np.moveaxis(prey, 0, -1))
+    predator = np.ascontiguousarray(np.moveaxis(predator, 0, -1))
+    harvest = np.ascontiguousarray(np.moveaxis(harvest, 0, -1))
+
+    # Calculate objectives and the predator collapse constraint across N realizations
+    objs, cnstr = fishery_objectives(prey, predator, harvest, K[:, 0])
 
-            if x[t] > 0 and y[t] > 0:
+    return objs, cnstr
 
-                x[t + 1] = (
-                    x[t]
-                    + b * x[t] * (1 - x[t] / K)
-                    - (a * x[t] * y[t]) / (np.power(y[t], m) + a * h * x[t])
-                    - z[t] * x[t]
-                ) * np.exp(
-                    epsilon_prey[i]
-                )  # Prey growth equation
-                y[t + 1] = (
-                    y[t] + c * a * x[t] * y[t] / (np.power(y[t], m) + a * h * x[t]) - d * y[t]
-                ) * np.exp(
-                    epsilon_predator[i]
-                )  # Predator growth equation
 
-                if t <= tSteps - 1:
+def fish_game_batch(
+    policies,
+    sows,
+    strategy="Previous_Prey",
+    N=100,
+    tSteps=100,
+    nObjs=5,
+    nCnstr=1,
+    processes=None,
+    chunk_size=100,
+    seed=None,
+    common_noise=False,
+):
+    """Evaluate one or more policies over many states of the world (SOWs).
+
+    Each (policy, SOW) pair gets its own N realizations of environmental stochasticity.  Without
+    a `seed` they are drawn in the calling process from the global NumPy random state in the same
+    order as calling `fish_game` for every policy and then every SOW.  With a `seed`, every pair
+    gets an independent child of ``SeedSequence(seed)`` and draws its own stream in the worker,
+    the same stream as ``fish_game(..., rng=child)``.  Either way the results do not depend on the
+    number of processes or the chunk size.
+
+    :param policies:                    decision variables (C, R, W) of one policy, or an array of
+                                        shape (n_policy, n_vars)
+    :param sows:                        array of shape (n_sow, 9) with columns a, b, c, d, h, K, m,
+                                        sigmaX, sigmaY, e.g. from `load_saltelli_param_values()`
+    :param strategy:                    management strategy
+    :param N:                           Number of realizations of environmental stochasticity
+    :param tSteps:                      no. of timesteps to run the fish game on
+    :param nObjs:                       no. of objectives in output
+    :param nCnstr:                      no. of constraints in output
+    :param processes:                   Number of worker processes; 1 runs every chunk in the
+                                        calling process and None uses one worker per CPU
+    :param chunk_size:                  Number of SOWs simulated together per task
+    :param seed:                        Optional integer or `numpy.random.SeedSequence` seeding
+                                        the stochasticity, or a list of one `SeedSequence` per SOW
+                                        used directly as that SOW's common noise stream
+    :param common_noise:                Share the realizations of each SOW across all policies
+                                        (common random numbers), so differences between policies
+                                        are not masked by sampling noise
+
+    :return:                            objectives of shape (n_policy, n_sow, nObjs) and
+                                        constraints of shape (n_policy, n_sow, nCnstr); the
+                                        constraint is the mean number of predator collapse days
 
-                    if strategy == "Previous_Prey":
-                        input_ranges = [[0, K]]  # Prey pop. range to use for normalization
-                        output_ranges = [[0, 1]]  # Range to de-normalize harvest to
-                        xt_scalar = float(np.asarray(x[t]).item())  # Safely extract a pure Python float
-                        z[t + 1] = hrvSTR([xt_scalar], vars, input_ranges, output_ranges)[0]
+    """
+    policies = np.atleast_2d(np.asarray(policies, dtype=float))
+    sows = np.atleast_2d(np.asarray(sows, dtype=float))
 
+    if sows.shape[1] != 9:
+        raise ValueError("`sows` must have 9 columns: a, b, c, d, h, K, m, sigmaX, sigmaY")
 
+    n_policy, n_sow = policies.shape[0], sows.shape[0]
 
+    # one stream of noise per SOW, shared by the policies, or per (policy, SOW) pair
+    shape = [n_sow] if common_noise else [n_policy, n_sow]
 
+    if seed is None:
+        # same draws as np.random.normal(0.0, sigma, N) for prey then predator in each fish_game call
+        noise = np.random.standard_normal(shape + [2, N])
+    elif isinstance(seed, (list, tuple)):
+        if len(seed) != n_sow:
+            raise ValueError(f"`seed` must hold one SeedSequence per SOW, {n_sow} in total")
 
+        common_noise = True
+        noise = np.empty(n_sow, dtype=object)
+        noise[:] = seed
+    else:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
 
+        noise = np.empty(int(np.prod(shape)), dtype=object)
+        noise[:] = seed.spawn(len(noise))
+        noise = noise.reshape(shape)
 
+    if common_noise:
+        noise = np.broadcast_to(noise, [n_policy] + list(noise.shape))
 
-            prey[i, t + 1] = x[t + 1]
-            predator[i, t + 1] = y[t + 1]
-            effort[i, t + 1] = z[t + 1]
-            harvest[i, t + 1] = z[t + 1] * x[t + 1]
-            NPVharvest = NPVharvest + harvest[i, t + 1] * (1 + 0.05) ** (-(t + 1))
+    objs = np.zeros([n_policy, n_sow, nObjs])
+    cnstr = np.zeros([n_policy, n_sow, nCnstr])
 
-        NPV[i] = NPVharvest
-        low_hrv = [
-            harvest[i, j] < prey[i, j] / 20 for j in range(len(harvest[i, :]))
-        ]  # Returns a list of True values when there's harvest below 5%
+    tasks = [
+        (p, start, min(start + chunk_size, n_sow))
+        for p in range(n_policy)
+        for start in range(0, n_sow, chunk_size)
+    ]
 
-        count = [
-            sum(1 for _ in group) for key, group in itertools.groupby(low_hrv) if key
-        ]  # Counts groups of True values in a row
+    def arguments(p, start, stop):
+        return policies[p], strategy, sows[start:stop], noise[p, start:stop], N, tSteps
 
-        if count:  # Checks if theres at least one count (if not, np.max won't work on empty list)
-            cons_low_harv[i] = np.max(count)  # Finds the largest number of consecutive low harvests
-        else:
-            cons_low_harv[i] = 0
+    def store(p, start, stop, result):
+        objs[p, start:stop, :FISH_GAME_OBJECTIVES] = result[0]
+        cnstr[p, start:stop, 0] = result[1]
 
-        harv_1st_pc[i] = np.percentile(harvest[i, :], 1)
-        variance[i] = np.var(harvest[i, :])
+    if processes == 1:
+        for task in tasks:
+            store(*task, _fish_game_task(*arguments(*task)))
+        return objs, cnstr
 
-    # Calculate objectives across N realizations
-    objs[0] = -np.mean(NPV)  # Mean NPV for all realizations
-    objs[1] = np.mean((K - prey) / K)  # Mean prey deficit
-    objs[2] = np.mean(
-        cons_low_harv
-    )  # Mean worst case of consecutive low harvest across realizations
-    objs[3] = -np.mean(harv_1st_pc)  # Mean 1st percentile of all harvests
-    objs[4] = np.mean(variance)  # Mean variance of harvest
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(_fish_game_task, *arguments(*task)): task for task in tasks}
 
-    cnstr[0] = np.mean(
-        (predator < 1).sum(axis=1)
-    )  # Mean number of predator extinction days per realization
+        for future in concurrent.futures.as_completed(futures):
+            store(*futures.pop(future), future.result())
 
     return objs, cnstr
 
 
+def _fish_game_task(vars, strategy, sows, noise, N, tSteps):
+    """Simulate a chunk of SOWs from standard normal noise or from one seed sequence per SOW."""
+
+    if noise.dtype == object:
+        noise = np.array([np.random.default_rng(i).standard_normal([2, N]) for i in noise])
+
+    epsilon_prey = sows[:, 7, None] * noise[:, 0]
+    epsilon_predator = sows[:, 8, None] * noise[:, 1]
+
+    return _fish_game_objectives(vars, strategy, sows, epsilon_prey, epsilon_predator, tSteps)
+
+
+def _carry_forward(values, alive):
+    """Return the next-step values of all realizations, filling collapsed ones from the one before.
+
+    Realizations whose prey or predator population has collapsed are not stepped; they take the
+    value of the previous realization of the same SOW at the same step (0 for the first
+    realizations), as the original per-realization loop did by reusing a single state array
+    across realizations.
+
+    """
+    index = np.where(alive, np.arange(values.shape[-1]), -1)
+    np.maximum.accumulate(index, axis=-1, out=index)
+    filled = np.take_along_axis(values, np.maximum(index, 0), axis=-1)
+
+    return np.where(index >= 0, filled, 0.0)
+
+
+class RBFPolicy:
+    """Radial basis function harvest policy with its decision variables unpacked once.
+
+    Decision variables are arranged in `vars` as nRBF consecutive sets of {nIn pairs of {C, R}
+    followed by nOut Ws}; e.g. for nRBF = 2, nIn = 3 and nOut = 4:
+    C, R, C, R, C, R, W, W, W, W, C, R, C, R, C, R, W, W, W, W
+
+    :param vars:                                    decision variables (C, R, W)
+    :param input_ranges:                            nIn pairs of [min, max] used to normalize inputs
+    :param output_ranges:                           nOut pairs of [min, max] used to de-normalize
+                                                    outputs
+    :param nRBF:                                    no. of RBFs to use
+    :param nIn:                                     no. of inputs
+    :param nOut:                                    no. of outputs
+
+    """
+
+    def __init__(self, vars, input_ranges, output_ranges, nRBF=2, nIn=1, nOut=1):
+
+        # C and R are nIn x nRBF and W is nOut x nRBF
+        block = np.asarray(vars[: nRBF * (2 * nIn + nOut)], dtype=float).reshape(nRBF, -1)
+        self.C = block[:, 0 : 2 * nIn : 2].T.copy()
+        self.R = block[:, 1 : 2 * nIn : 2].T.copy()
+        self.W = block[:, 2 * nIn :].T.copy()
+
+        # Normalize weights to sum to 1 across the RBFs (each row of W should sum to 1)
+        totals = np.sum(self.W, 1)
+        self.W[totals > 0] /= totals[totals > 0, None]
+
+        # set so as to avoid division by 0
+        self.R[self.R <= 10**-6] = 10**-6
+
+        input_ranges = np.asarray(input_ranges, dtype=float)
+        output_ranges = np.asarray(output_ranges, dtype=float)
+        self.in_min = input_ranges[:, 0]
+        self.in_span = input_ranges[:, 1] - input_ranges[:, 0]
+        self.out_min = output_ranges[:, 0]
+        self.out_span = output_ranges[:, 1] - output_ranges[:, 0]
+
+    def __call__(self, inputs):
+        """Calculate the outputs for an (n_samples, nIn) array of inputs.
+
+        :param inputs:                              array of shape (n_samples, nIn), or (nIn,) for a
+                                                    single sample
+
+        :return:                                    array of shape (n_samples, nOut), or (nOut,)
+
+        """
+        inputs = np.asarray(inputs, dtype=float)
+        norm_in = (np.atleast_2d(inputs) - self.in_min) / self.in_span
+
+        # (n_samples, nIn, nRBF) distances summed over the inputs
+        BF = np.sum(((norm_in[:, :, None] - self.C) / self.R) ** 2, axis=1)
+
+        # (n_samples, nOut) weighted sum over the RBFs
+        u = np.sum(self.W * np.exp(-BF)[:, None, :], axis=2)
+
+        norm_u = self.out_min + u * self.out_span
+
+        return norm_u[0] if inputs.ndim == 1 else norm_u
+
+
 def hrvSTR(Inputs, vars, input_ranges, output_ranges, nRBF=2, nIn=1, nOut=1):
     """Calculate outputs (u) corresponding to each sample of inputs
     u is a 2-D matrix with nOut columns (1 for each output) and as many rows as
     there are samples of inputs
 
+    Build an `RBFPolicy` once instead when evaluating the same `vars` repeatedly.
+
     :param Inputs:
     :param vars:
     :param input_ranges:
@@ -331,54 +560,4 @@ def hrvSTR(Inputs, vars, input_ranges, output_ranges, nRBF=2, nIn=1, nOut=1):
 
     """
 
-    # Rearrange decision variables into C, R, and W arrays
-    # C and R are nIn x nRBF and W is nOut x nRBF
-    # Decision variables are arranged in 'vars' as nRBF consecutive
-    # sets of {nIn pairs of {C, R} followed by nOut Ws}
-    # E.g. for nRBF = 2, nIn = 3 and nOut = 4:
-    # C, R, C, R, C, R, W, W, W, W, C, R, C, R, C, R, W, W, W, W
-    C = np.zeros([nIn, nRBF])
-    R = np.zeros([nIn, nRBF])
-    W = np.zeros([nOut, nRBF])
-    for n in range(nRBF):
-        for m in range(nIn):
-            C[m, n] = vars[(2 * nIn + nOut) * n + 2 * m]
-            R[m, n] = vars[(2 * nIn + nOut) * n + 2 * m + 1]
-        for k in range(nOut):
-            W[k, n] = vars[(2 * nIn + nOut) * n + 2 * nIn + k]
-
-    # Normalize weights to sum to 1 across the RBFs (each row of W should sum to 1)
-    totals = np.sum(W, 1)
-    for k in range(nOut):
-        if totals[k] > 0:
-            W[k, :] = W[k, :] / totals[k]
-
-    # Normalize inputs
-    norm_in = np.zeros(nIn)
-    for m in range(nIn):
-        norm_in[m] = (Inputs[m] - input_ranges[m][0]) / (input_ranges[m][1] - input_ranges[m][0])
-
-    # Create array to store outputs
-    u = np.zeros(nOut)
-
-    # Calculate RBFs
-    for k in range(nOut):
-
-        for n in range(nRBF):
-            BF = 0
-
-            for m in range(nIn):
-                if R[m, n] > 10**-6:  # set so as to avoid division by 0
-                    BF = BF + ((norm_in[m] - C[m, n]) / R[m, n]) ** 2
-                else:
-                    BF = BF + ((norm_in[m] - C[m, n]) / (10**-6)) ** 2
-
-            u[k] = u[k] + W[k, n] * np.exp(-BF)
-
-    # De-normalize outputs
-    norm_u = np.zeros(nOut)
-
-    for k in range(nOut):
-        norm_u[k] = output_ranges[k][0] + u[k] * (output_ranges[k][1] - output_ranges[k][0])
-
-    return norm_u
+    return RBFPolicy(vars, input_ranges, output_ranges, nRBF, nIn, nOut)(Inputs)
@@ -1,9 +1,19 @@
+import collections
+import concurrent.futures
+import json
 import math
+import os
+
 import numpy as np
+import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
 from matplotlib.lines import Line2D
+from scipy.stats import norm
+from SALib.analyze import delta, sobol
+
+from msdbook.metrics import kge, mse, nse
 
 
 def plot_observed_vs_simulated_streamflow(df, hymod_dict, figsize=[12, 6]):
@@ -306,28 +316,69 @@ def plot_precalibration_glue(df_precal, df_glue, df_obs, figsize=[10, 4]):
     return ax
 
 
-def Pdm01(Hpar, Bpar, Hbeg, PP, PET):
-    """Fill in description."""
+class PdmParameters:
+    """Parameter-derived constants of the soil moisture accounting store.
+
+    These depend only on `Huz` and `B`, so they are computed once per parameter set (or once per
+    ensemble when given arrays) rather than on every day of a run.
+
+    :param Hpar:                Max height of soil moisture accounting tank
+    :param Bpar:                Distribution function shape parameter
+
+    """
+
+    __slots__ = ("Hpar", "b", "Cpar", "exponent", "inv_exponent")
+
+    def __init__(self, Hpar, Bpar):
+
+        log = math.log if np.ndim(Bpar) == 0 else np.log
+
+        self.Hpar = Hpar
+        self.b = log(1 - Bpar / 2) / math.log(0.5)
+        self.Cpar = Hpar / (1 + self.b)
+        self.exponent = 1 + self.b
+        self.inv_exponent = 1 / (1 + self.b)
 
-    b = math.log(1 - Bpar / 2) / math.log(0.5)
-    Cpar = Hpar / (1 + b)
-    Cbeg = Cpar * (1 - (1 - Hbeg / Hpar) ** (1 + b))
+
+def pdm_step(pars, Hbeg, PP, PET):
+    """Advance the soil moisture accounting store one day for a single parameter set.
+
+    :param pars:                `PdmParameters` of the parameter set
+    :type pars:                 PdmParameters
+
+    :param Hbeg:                Storage height at the start of the day
+    :param PP:                  Precipitation
+    :param PET:                 Potential evapotranspiration
+
+    :return:                    A tuple of overflow, evapotranspiration, end height and end storage
+
+    """
+    Hpar = pars.Hpar
+    Cpar = pars.Cpar
+
+    Cbeg = Cpar * (1 - (1 - Hbeg / Hpar) ** pars.exponent)
 
     OV2 = max(PP + Hbeg - Hpar, 0)
     PPinf = PP - OV2
 
     Hint = min((PPinf + Hbeg), Hpar)
-    Cint = Cpar * (1 - (1 - Hint / Hpar) ** (1 + b))
+    Cint = Cpar * (1 - (1 - Hint / Hpar) ** pars.exponent)
     OV1 = max(PPinf + Cbeg - Cint, 0)
 
     OV = OV1 + OV2
     ET = min(PET, Cint)
     Cend = Cint - ET
-    Hend = Hpar * (1 - (1 - Cend / Cpar) ** (1 / (1 + b)))
+    Hend = Hpar * (1 - (1 - Cend / Cpar) ** pars.inv_exponent)
 
     return OV, ET, Hend, Cend
 
 
+def Pdm01(Hpar, Bpar, Hbeg, PP, PET):
+    """Advance the soil moisture accounting store one day; see `pdm_step` for repeated calls."""
+
+    return pdm_step(PdmParameters(Hpar, Bpar), Hbeg, PP, PET)
+
+
 def Nash(K, N, Xbeg, Inp):
     """Fill in description."""
     OO = np.zeros(N)
@@ -344,7 +395,7 @@ def Nash(K, N, Xbeg, Inp):
         for Res in range(0, N):
             OO[Res] = K * Xbeg[Res]
             Xend[Res] = Xbeg[Res] - OO[Res]
-            
+
             if Res == 0:
                 Xend[Res] += Inp  # Add input only to the first time step
             else:
@@ -354,70 +405,258 @@ def Nash(K, N, Xbeg, Inp):
     return out, Xend
 
 
-def Hymod01(Data, Pars, InState):
-    """Need to grow XHuz and others"""
+def nash_cascade(K, X, Inp, work=None):
+    """Route `Inp` through a cascade of linear reservoirs, updating the storages in place.
 
-    # initialize arrays
-    XHuz = np.zeros(len(Data))
-    XHuz[0] = InState["XHuz"]
+    Performs the same arithmetic as `Nash` for an array state without allocating new state arrays.
 
-    Xs = np.zeros(len(Data))
-    Xs[0] = InState["Xs"]
+    :param K:                   Reservoir rate parameter; a scalar or an array of shape X.shape[:-1]
+    :param X:                   Reservoir storages along the last axis, shape (N,) for one parameter
+                                set or (n, N) for an ensemble; updated in place
+    :type X:                    numpy.ndarray
 
-    Xq = np.zeros([len(Data), Pars["Nq"]])
-    Xq[0, :] = InState["Xq"]
+    :param Inp:                 Inflow to the first reservoir
+    :param work:                Optional scratch array of shape (2,) + X.shape[:-1]; ensemble
+                                outflows are then written into it rather than into new arrays
 
-    OV = np.zeros(len(Data))
-    ET = np.zeros(len(Data))
-    XCuz = np.zeros(len(Data))
-    Qq = np.zeros(len(Data))
-    Qs = np.zeros(len(Data))
-    Q = np.zeros(len(Data))
+    :return:                    Outflow of the last reservoir, which is a view of `work` if given
 
-    for i in range(0, len(Data)):
+    """
+    inflow = Inp
 
-        # run soil moisture accounting including evapotranspiration
-        OV[i], ET[i], XHuz[i], XCuz[i] = Pdm01(
-                Pars["Huz"], Pars["B"], XHuz[i], Data["Precip"].iloc[i], Data["Pot_ET"].iloc[i]
-            )
+    # element access is much cheaper than 0-d views for a single parameter set
+    if X.ndim == 1:
+        for r in range(X.shape[0]):
+            out = K * X[r]
+            X[r] = X[r] - out + inflow
+            inflow = out
 
-        # run Nash Cascade routing of quickflow component
-        Qq[i], Xq[i, :] = Nash(Pars["Kq"], Pars["Nq"], Xq[i, :], Pars["Alp"] * OV[i])
+        return inflow
 
-        # run slow flow component, one infinite linear tank
-        Xs_scalar = Xs[i].item() if np.ndim(Xs[i]) == 0 else Xs[i]  # Ensure scalar extraction
-        OV_scalar = (1 - Pars["Alp"]) * OV[i]
+    for r in range(X.shape[-1]):
+        Xr = X[..., r]
+
+        if work is None:
+            out = K * Xr
+        else:
+            out = np.multiply(K, Xr, out=work[r % 2])
+
+        Xr -= out
+        Xr += inflow
+        inflow = out
+
+    return inflow
+
+
+def linear_reservoir(K, X, out=None):
+    """Drain a single linear reservoir, the N == 1 case of `Nash` with a scalar state.
+
+    Mirrors the scalar-state branch of `Nash` used for the HYMOD slow flow tank, which releases
+    K * X and does not add the inflow to the store.
+
+    :param K:                   Reservoir rate parameter; a scalar or an array shaped like X
+    :param X:                   Reservoir storage; a scalar or an array for an ensemble
+    :param out:                 Optional array receiving the outflow; X is then updated in place
+
+    :return:                    A tuple of the outflow and the end storage
+
+    """
+    if out is None:
+        Q = K * X
+        return Q, X - Q
+
+    np.multiply(K, X, out=out)
+    X -= out
+
+    return out, X
+
+
+class HymodForcing:
+    """Daily HYMOD forcing held as contiguous float64 arrays.
+
+    Build it once, e.g. ``HymodForcing.from_dataframe(load_hymod_input_file())``, and pass it to
+    `hymod`, `Hymod01` or the ensemble drivers in place of the dataframe to avoid pandas indexing
+    and copies on every run.
+
+    :param precip:              Daily precipitation
+    :param pet:                 Daily potential evapotranspiration
+    :param strmflw:             Optional daily observed streamflow
 
-        nash_output = Nash(Pars["Ks"], 1, Xs_scalar, OV_scalar)
+    """
+
+    def __init__(self, precip, pet, strmflw=None):
+
+        self.precip = np.ascontiguousarray(precip, dtype=np.float64)
+        self.pet = np.ascontiguousarray(pet, dtype=np.float64)
+        self.strmflw = None if strmflw is None else np.ascontiguousarray(strmflw, dtype=np.float64)
+
+        if self.precip.shape != self.pet.shape:
+            raise ValueError("`precip` and `pet` must have the same length")
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Build the forcing from a dataframe with columns Precip, Pot_ET and optionally Strmflw."""
+
+        return cls(df["Precip"], df["Pot_ET"], df["Strmflw"] if "Strmflw" in df else None)
+
+    def __len__(self):
+        return len(self.precip)
+
+    def __getitem__(self, key):
+        """Slice the record in time; the returned forcing shares memory with this one."""
+
+        if not isinstance(key, slice):
+            raise TypeError("HymodForcing only supports slicing along time")
+
+        return HymodForcing(
+            self.precip[key], self.pet[key], None if self.strmflw is None else self.strmflw[key]
+        )
+
+
+def as_hymod_forcing(data, ndays=None):
+    """Return `data` as a `HymodForcing` limited to the first `ndays` days.
+
+    :param data:                A `HymodForcing` or a dataframe of hymod data
+    :param ndays:               The number of days to keep; defaults to the full record
+
+    """
+    if not isinstance(data, HymodForcing):
+        data = HymodForcing.from_dataframe(data)
+
+    return data if ndays is None else data[:ndays]
+
+
+# names of the outputs produced by `Hymod01` and `hymod_ensemble`
+HYMOD_OUTPUTS = ("XHuz", "XCuz", "Xq", "Xs", "ET", "OV", "Qq", "Qs", "Q")
+
+
+def _select_outputs(outputs):
+    """Validate an output selection and return it as a tuple of names from `HYMOD_OUTPUTS`."""
+
+    if outputs is None:
+        return HYMOD_OUTPUTS
+
+    if isinstance(outputs, str):
+        outputs = (outputs,)
+
+    unknown = [i for i in outputs if i not in HYMOD_OUTPUTS]
+    if unknown:
+        raise ValueError(f"Unknown HYMOD outputs {unknown}; choose from {HYMOD_OUTPUTS}")
 
-        Qs[i] = nash_output[0]
-        Xs[i] = nash_output[1][0]
-        
+    return tuple(outputs)
 
-        if i < len(Data) - 1:
-                XHuz[i + 1] = XHuz[i]
-                Xq[i + 1, :] = Xq[i, :]  # Fixed
-                Xs[i + 1] = Xs[i]
 
-        Q[i] = Qs[i] + Qq[i]
+def Hymod01(Data, Pars, InState, outputs=None, return_state=False, dtype=np.float64):
+    """Run HYMOD over every day of `Data`, carrying the model states forward as rolling values.
 
-    # write to a dict
+    :param Data:                A `HymodForcing` or dataframe of hymod data including columns for
+                                Precip and Pot_ET
+    :param Pars:                Dictionary of model parameters Nq, Kq, Ks, Alp, Huz and B
+    :type Pars:                 dict
+
+    :param InState:             Dictionary of initial states Xq, Xs and XHuz
+    :type InState:              dict
+
+    :param outputs:             Names from `HYMOD_OUTPUTS` to keep as daily time series; defaults to
+                                all of them.  Only the selected arrays are allocated, so
+                                `outputs=["Q"]` keeps a single array of length ndays.
+    :type outputs:              list
+
+    :param return_state:        If True, also return the model state at the end of the last day
+    :type return_state:         bool
+
+    :param dtype:               Data type of the output arrays; the states are always accumulated
+                                in double precision, see `hymod_ensemble` for the rounding
+    :type dtype:                numpy.dtype
+
+    :return:                    A dictionary holding the selected time series, and the end state as
+                                a dictionary in the form of `InState` when `return_state` is True
+
+    """
+    outputs = _select_outputs(outputs)
+
+    Data = as_hymod_forcing(Data)
+    ndays = len(Data)
+
+    # initialize the selected output arrays only
     Model = {
-        "XHuz": XHuz,
-        "XCuz": XCuz,
-        "Xq": Xq,
-        "Xs": Xs,
-        "ET": ET,
-        "OV": OV,
-        "Qq": Qq,
-        "Qs": Qs,
-        "Q": Q,
+        key: np.zeros([ndays, Pars["Nq"]], dtype=dtype) if key == "Xq" else np.zeros(ndays, dtype)
+        for key in outputs
     }
+    record = [(HYMOD_OUTPUTS.index(key), Model[key]) for key in outputs]
+
+    # soil moisture constants depend only on the parameters
+    pdm = PdmParameters(Pars["Huz"], Pars["B"])
+
+    # rolling model states
+    XHuz = InState["XHuz"]
+    Xs = InState["Xs"]
+    Xq = np.zeros(Pars["Nq"]) + InState["Xq"]
+
+    # iterate over plain floats rather than indexing arrays every day
+    for i, (PP, PET) in enumerate(zip(Data.precip.tolist(), Data.pet.tolist())):
+
+        # run soil moisture accounting including evapotranspiration
+        OV, ET, XHuz, XCuz = pdm_step(pdm, XHuz, PP, PET)
+
+        # run Nash Cascade routing of quickflow component
+        Qq = nash_cascade(Pars["Kq"], Xq, Pars["Alp"] * OV)
+
+        # run slow flow component, one infinite linear tank
+        Qs, Xs = linear_reservoir(Pars["Ks"], Xs)
+
+        day = (XHuz, XCuz, Xq, Xs, ET, OV, Qq, Qs, Qs + Qq)
+        for index, arr in record:
+            arr[i] = day[index]
+
+    if return_state:
+        return Model, {"Xq": Xq.copy(), "Xs": Xs, "XHuz": XHuz}
 
     return Model
 
 
-def hymod(Nq, Kq, Ks, Alp, Huz, B, hymod_dataframe, ndays):
+def get_hymod_state(results, day=-1):
+    """Extract the model state at the end of `day` from a HYMOD run.
+
+    The returned dictionary can be passed as `init` to `hymod` or `hymod_ensemble` to continue the
+    simulation from the following day.
+
+    :param results:             Output dictionary of `Hymod01`, `hymod` or `hymod_ensemble`; it must
+                                include the XHuz, Xs and Xq outputs
+    :type results:              dict
+
+    :param day:                 Index of the day whose end state is returned; defaults to the last
+    :type day:                  int
+
+    :return:                    A dictionary of states Xq, Xs and XHuz
+
+    """
+    missing = [i for i in ("XHuz", "Xs", "Xq") if i not in results]
+    if missing:
+        raise KeyError(f"The HYMOD results do not include the state outputs {missing}")
+
+    return {
+        "Xq": np.array(results["Xq"][day]),
+        "Xs": np.array(results["Xs"][day])[()],
+        "XHuz": np.array(results["XHuz"][day])[()],
+    }
+
+
+def hymod(
+    Nq,
+    Kq,
+    Ks,
+    Alp,
+    Huz,
+    B,
+    hymod_dataframe,
+    ndays,
+    outputs=None,
+    init=None,
+    start=0,
+    return_state=False,
+    dtype=np.float64,
+):
     """Hymod main function.
 
     :param Nq:                  number of quickflow routing tanks
@@ -427,19 +666,1030 @@ def hymod(Nq, Kq, Ks, Alp, Huz, B, hymod_dataframe, ndays):
     :param Huz:                 Max height of soil moisture accounting tanks
     :param B:                   Distribution function shape parameter
 
-    :param hymod_dataframe:     Dataframe of hymod data
+    :param hymod_dataframe:     A `HymodForcing` or dataframe of hymod data
     :param ndays:               The number of days to process from the beginning of the record
+    :param outputs:             Names from `HYMOD_OUTPUTS` to return; defaults to all of them
+    :param init:                Initial states Xq, Xs and XHuz, e.g. from `get_hymod_state`; defaults
+                                to empty stores
+    :param start:               Index of the first day of the record to process
+    :param return_state:        If True, also return the model state at the end of the run
+    :param dtype:               Data type of the output arrays, e.g. numpy.float32 to halve memory
 
     """
-    # read in observed rainfall-runoff data for one year
-    data = hymod_dataframe.iloc[0:ndays].copy()
+    # read in observed rainfall-runoff data as views over the forcing arrays
+    data = as_hymod_forcing(hymod_dataframe)[start : None if ndays is None else start + ndays]
 
     # assign parameters
     pars = {"Nq": Nq, "Kq": Kq, "Ks": Ks, "Alp": Alp, "Huz": Huz, "B": B}
 
     # Initialize states
-    init = {"Xq": np.zeros(pars["Nq"]), "Xs": 0, "XHuz": 0}
+    if init is None:
+        init = {"Xq": np.zeros(pars["Nq"]), "Xs": 0, "XHuz": 0}
+
+    results = Hymod01(data, pars, init, outputs=outputs, return_state=return_state, dtype=dtype)
+
+    return results
+
+
+class HymodWarmupCache:
+    """Cache of HYMOD states at the end of the warm-up period, keyed by parameter set.
+
+    Runs started through the cache skip re-simulating the warm-up days for parameter sets that have
+    been seen before, which suits split-period calibration and rolling-window forecasting.
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data
+    :param warmup_days:         Number of days at the start of the record used for warm-up
+    :type warmup_days:          int
+
+    :param maxsize:             Maximum number of cached states; the least recently used state is
+                                dropped first.  None keeps every state.
+    :type maxsize:              int
+
+    """
+
+    def __init__(self, forcing, warmup_days=365, maxsize=None):
+
+        self.forcing = as_hymod_forcing(forcing)
+        self.warmup_days = warmup_days
+        self.maxsize = maxsize
+        self._states = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def state(self, Nq, Kq, Ks, Alp, Huz, B):
+        """Return the warm-up end state for a parameter set, simulating it on first use."""
+
+        key = (Nq, Kq, Ks, Alp, Huz, B)
+
+        if key in self._states:
+            self._states.move_to_end(key)
+        else:
+            _, self._states[key] = hymod(
+                Nq,
+                Kq,
+                Ks,
+                Alp,
+                Huz,
+                B,
+                self.forcing,
+                self.warmup_days,
+                outputs=(),
+                return_state=True,
+            )
+            if self.maxsize is not None and len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+
+        state = self._states[key]
+
+        return {"Xq": state["Xq"].copy(), "Xs": state["Xs"], "XHuz": state["XHuz"]}
+
+    def run(self, Nq, Kq, Ks, Alp, Huz, B, ndays=None, outputs=None, start=None):
+        """Run HYMOD from the cached warm-up state.
+
+        :param ndays:           The number of days to process after the warm-up period; defaults to
+                                the rest of the record
+        :param outputs:         Names from `HYMOD_OUTPUTS` to return; defaults to all of them
+        :param start:           Index of the first day to process; defaults to the first day after
+                                warm-up and must not be earlier than it
+
+        """
+        start = self.warmup_days if start is None else start
+
+        if start < self.warmup_days:
+            raise ValueError("`start` must not fall within the warm-up period")
+
+        init = self.state(Nq, Kq, Ks, Alp, Huz, B)
+
+        # simulate any gap between the end of warm-up and the requested start
+        if start > self.warmup_days:
+            _, init = hymod(
+                Nq,
+                Kq,
+                Ks,
+                Alp,
+                Huz,
+                B,
+                self.forcing,
+                start - self.warmup_days,
+                outputs=(),
+                init=init,
+                start=self.warmup_days,
+                return_state=True,
+            )
+
+        return hymod(
+            Nq, Kq, Ks, Alp, Huz, B, self.forcing, ndays, outputs=outputs, init=init, start=start
+        )
+
+
+# column order of the parameter array accepted by the ensemble engine
+HYMOD_PARAMETERS = ("Kq", "Ks", "Alp", "Huz", "B")
+
+
+def _pdm_step_ensemble(pars, Hbeg, PP, PET):
+    """Vectorized form of `pdm_step` operating elementwise over an ensemble of parameter sets."""
+
+    Hpar = pars.Hpar
+    Cpar = pars.Cpar
+
+    Cbeg = Cpar * (1 - (1 - Hbeg / Hpar) ** pars.exponent)
+
+    OV2 = np.maximum(PP + Hbeg - Hpar, 0)
+    PPinf = PP - OV2
+
+    Hint = np.minimum(PPinf + Hbeg, Hpar)
+    Cint = Cpar * (1 - (1 - Hint / Hpar) ** pars.exponent)
+    OV1 = np.maximum(PPinf + Cbeg - Cint, 0)
+
+    OV = OV1 + OV2
+    ET = np.minimum(PET, Cint)
+    Cend = Cint - ET
+    Hend = Hpar * (1 - (1 - Cend / Cpar) ** pars.inv_exponent)
+
+    return OV, ET, Hend, Cend
+
+
+def hymod_ensemble(
+    params,
+    forcing,
+    Nq=3,
+    ndays=None,
+    outputs=None,
+    init=None,
+    start=0,
+    return_state=False,
+    dtype=np.float64,
+    state_dtype=np.float64,
+):
+    """Run HYMOD for an ensemble of parameter sets, stepping every set forward together.
+
+    Each day is computed once for the whole ensemble using arrays along the parameter axis, which
+    replaces one `hymod` call per parameter set in sampling workflows.
+
+    :param params:              Array of shape (n, 5) with columns ordered as `HYMOD_PARAMETERS`
+                                (Kq, Ks, Alp, Huz, B)
+    :type params:               numpy.ndarray
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data
+    :param Nq:                  number of quickflow routing tanks shared by all parameter sets
+    :type Nq:                   int
+
+    :param ndays:               The number of days to process from the beginning of the record;
+                                defaults to the full record
+    :type ndays:                int
+
+    :param outputs:             Names from `HYMOD_OUTPUTS` to keep; defaults to all of them
+    :type outputs:              list
+
+    :param init:                Initial states Xq, Xs and XHuz broadcastable to shapes (n, Nq), (n,)
+                                and (n,), e.g. from `get_hymod_state`; defaults to empty stores
+    :type init:                 dict
+
+    :param start:               Index of the first day of the record to process
+    :type start:                int
+
+    :param return_state:        If True, also return the ensemble state at the end of the run
+    :type return_state:         bool
+
+    :param dtype:               Data type of the output arrays.  With float32 outputs and float64
+                                states every stored value is the float64 result rounded once.
+    :type dtype:                numpy.dtype
+
+    :param state_dtype:         Data type used to accumulate the model states.  Running the states in
+                                float32 as well reduces the working memory of the loop but lets
+                                rounding errors accumulate over the record, so compare against a
+                                float64 run before relying on it.
+    :type state_dtype:          numpy.dtype
+
+    :return:                    A dictionary with the selected keys of `Hymod01`; time series have
+                                shape (ndays, n) and Xq has shape (ndays, n, Nq).  The end state is
+                                returned as a second value when `return_state` is True.
+
+    """
+    outputs = _select_outputs(outputs)
+
+    params = np.atleast_2d(np.asarray(params, dtype=state_dtype))
+
+    if params.shape[1] != len(HYMOD_PARAMETERS):
+        raise ValueError(
+            f"`params` must have {len(HYMOD_PARAMETERS)} columns ordered as {HYMOD_PARAMETERS}"
+        )
+
+    forcing = as_hymod_forcing(forcing)[start : None if ndays is None else start + ndays]
+    precip = forcing.precip.astype(state_dtype, copy=False)
+    pet = forcing.pet.astype(state_dtype, copy=False)
+    ndays = len(forcing)
+    n = params.shape[0]
+
+    Kq, Ks, Alp, Huz, B = params.T
+
+    # soil moisture constants depend only on the parameters
+    pdm = PdmParameters(Huz, B)
+
+    # rolling model states
+    if init is None:
+        init = {"Xq": 0.0, "Xs": 0.0, "XHuz": 0.0}
+    hbeg = np.zeros(n, state_dtype) + np.asarray(init["XHuz"], state_dtype)
+    xs = np.zeros(n, state_dtype) + np.asarray(init["Xs"], state_dtype)
+    xq = np.zeros((n, Nq), state_dtype) + np.asarray(init["Xq"], state_dtype)
+
+    # scratch space for the routing kernels
+    work = np.zeros((2, n), state_dtype)
+    Qs = np.zeros(n, state_dtype)
+
+    # initialize the selected output arrays only
+    Model = {
+        key: np.zeros((ndays, n, Nq), dtype) if key == "Xq" else np.zeros((ndays, n), dtype)
+        for key in outputs
+    }
+    record = [(HYMOD_OUTPUTS.index(key), Model[key]) for key in outputs]
+
+    for i in range(ndays):
+
+        # run soil moisture accounting including evapotranspiration
+        OV, ET, hbeg, XCuz = _pdm_step_ensemble(pdm, hbeg, precip[i], pet[i])
+
+        # run Nash Cascade routing of quickflow component
+        Qq = nash_cascade(Kq, xq, Alp * OV, work=work)
+
+        # run slow flow component, one infinite linear tank
+        linear_reservoir(Ks, xs, out=Qs)
+
+        day = (hbeg, XCuz, xq, xs, ET, OV, Qq, Qs, Qs + Qq)
+        for index, arr in record:
+            arr[i] = day[index]
+
+    if return_state:
+        return Model, {"Xq": xq.copy(), "Xs": xs.copy(), "XHuz": hbeg}
+
+    return Model
+
+
+def _iter_forcing_chunks(forcing, chunk_days):
+    """Yield `HymodForcing` chunks from a full record or from an iterable of record pieces."""
+
+    if isinstance(forcing, (HymodForcing, pd.DataFrame)):
+        forcing = as_hymod_forcing(forcing)
+        for i in range(0, len(forcing), chunk_days):
+            yield forcing[i : i + chunk_days]
+    else:
+        for chunk in forcing:
+            yield as_hymod_forcing(chunk)
+
+
+def iter_hymod(
+    Nq, Kq, Ks, Alp, Huz, B, forcing, chunk_days=365, outputs=None, init=None, dtype=np.float64
+):
+    """Run HYMOD chunk by chunk, yielding the outputs of each chunk as it is simulated.
+
+    The model state is carried across chunk boundaries, so concatenating the yielded outputs gives
+    the same result as a single `hymod` call while memory stays bounded by the chunk length.
+
+    :param Nq:                  number of quickflow routing tanks
+    :param Kq:                  quickflow routing tanks parameters
+    :param Ks:                  slowflow routing tanks rate parameter
+    :param Alp:                 Quick-slow split parameters
+    :param Huz:                 Max height of soil moisture accounting tanks
+    :param B:                   Distribution function shape parameter
+
+    :param forcing:             A `HymodForcing` or dataframe split into chunks of `chunk_days`, or an
+                                iterable yielding consecutive pieces of the record, e.g. from a
+                                synthetic forcing generator
+    :param chunk_days:          Number of days per chunk when `forcing` is a full record
+    :param outputs:             Names from `HYMOD_OUTPUTS` to yield; defaults to all of them
+    :param init:                Initial states Xq, Xs and XHuz; defaults to empty stores
+    :param dtype:               Data type of the yielded output arrays
+
+    """
+    state = init
+
+    for chunk in _iter_forcing_chunks(forcing, chunk_days):
+        results, state = hymod(
+            Nq,
+            Kq,
+            Ks,
+            Alp,
+            Huz,
+            B,
+            chunk,
+            None,
+            outputs=outputs,
+            init=state,
+            return_state=True,
+            dtype=dtype,
+        )
+        yield results
+
+
+def iter_hymod_ensemble(
+    params,
+    forcing,
+    Nq=3,
+    chunk_days=365,
+    outputs=None,
+    init=None,
+    dtype=np.float64,
+    state_dtype=np.float64,
+):
+    """Run `hymod_ensemble` chunk by chunk, yielding the outputs of each chunk.
+
+    :param params:              Array of shape (n, 5) with columns ordered as `HYMOD_PARAMETERS`
+    :param forcing:             A `HymodForcing` or dataframe split into chunks of `chunk_days`, or an
+                                iterable yielding consecutive pieces of the record
+    :param Nq:                  number of quickflow routing tanks shared by all parameter sets
+    :param chunk_days:          Number of days per chunk when `forcing` is a full record
+    :param outputs:             Names from `HYMOD_OUTPUTS` to yield; defaults to all of them
+    :param init:                Initial ensemble states Xq, Xs and XHuz; defaults to empty stores
+    :param dtype:               Data type of the yielded output arrays
+    :param state_dtype:         Data type used to accumulate the model states
+
+    """
+    state = init
+
+    for chunk in _iter_forcing_chunks(forcing, chunk_days):
+        results, state = hymod_ensemble(
+            params,
+            chunk,
+            Nq=Nq,
+            outputs=outputs,
+            init=state,
+            return_state=True,
+            dtype=dtype,
+            state_dtype=state_dtype,
+        )
+        yield results
+
+
+def accumulate_hymod_chunks(chunks, key="Q"):
+    """Reduce a stream of HYMOD chunk outputs to running totals along time.
+
+    :param chunks:              Iterable of output dictionaries from `iter_hymod` or
+                                `iter_hymod_ensemble`
+    :param key:                 Name of the output to aggregate
+    :type key:                  str
+
+    :return:                    A dictionary with the number of days and the sum, mean, min and max
+                                of the output over time
+
+    """
+    count = 0
+    total = minimum = maximum = None
+
+    for results in chunks:
+        arr = results[key]
+
+        if len(arr) == 0:
+            continue
+
+        if count == 0:
+            total = arr.sum(axis=0)
+            minimum = arr.min(axis=0)
+            maximum = arr.max(axis=0)
+        else:
+            total = total + arr.sum(axis=0)
+            minimum = np.minimum(minimum, arr.min(axis=0))
+            maximum = np.maximum(maximum, arr.max(axis=0))
+
+        count += len(arr)
+
+    if count == 0:
+        raise ValueError("No days were simulated")
+
+    return {"count": count, "sum": total, "mean": total / count, "min": minimum, "max": maximum}
+
+
+def _hymod_ensemble_chunk(params, forcing, Nq, ndays, dtype, state_dtype):
+    """Worker for `simulate_hymod_sample`; returns only the total flow of one chunk of parameter sets."""
+
+    return hymod_ensemble(
+        params, forcing, Nq=Nq, ndays=ndays, outputs=["Q"], dtype=dtype, state_dtype=state_dtype
+    )["Q"]
+
+
+def _order_parameters(problem, param_values):
+    """Reorder the columns of a SALib sample matrix to the `HYMOD_PARAMETERS` ordering."""
+
+    names = list(problem["names"])
+
+    if sorted(names) != sorted(HYMOD_PARAMETERS):
+        raise ValueError(f"`problem['names']` must contain exactly {HYMOD_PARAMETERS}")
+
+    param_values = np.atleast_2d(np.asarray(param_values, dtype=np.float64))
+
+    return param_values[:, [names.index(i) for i in HYMOD_PARAMETERS]]
+
+
+def simulate_hymod_sample(
+    param_values,
+    forcing,
+    Nq=3,
+    ndays=None,
+    processes=None,
+    chunk_size=256,
+    out=None,
+    dtype=np.float64,
+    state_dtype=np.float64,
+):
+    """Run HYMOD for every row of a sample matrix, fanning chunks of rows out over a process pool.
+
+    Each chunk is simulated with `hymod_ensemble` and written into a preallocated output array as
+    soon as it finishes, so only the chunks in flight are held twice in memory.
+
+    :param param_values:        Array of shape (n, 5) with columns ordered as `HYMOD_PARAMETERS`
+    :type param_values:         numpy.ndarray
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data
+    :param Nq:                  number of quickflow routing tanks
+    :type Nq:                   int
+
+    :param ndays:               The number of days to process from the beginning of the record;
+                                defaults to the full record
+    :type ndays:                int
+
+    :param processes:           Number of worker processes; 1 runs every chunk in the calling process
+                                and None uses one worker per CPU
+    :type processes:            int
+
+    :param chunk_size:          Number of parameter sets simulated per task
+    :type chunk_size:           int
+
+    :param out:                 Optional preallocated array of shape (ndays, n) to write into
+
+    :param dtype:               Data type of the output array when `out` is not given; float32
+                                halves memory, see `hymod_ensemble` for the rounding
+    :param state_dtype:         Data type used to accumulate the model states
+
+    :return:                    Array of simulated total flow with shape (ndays, n)
+
+    """
+    param_values = np.atleast_2d(np.asarray(param_values, dtype=np.float64))
+    n = param_values.shape[0]
+
+    # ship plain arrays rather than a dataframe to the workers
+    forcing = as_hymod_forcing(forcing, ndays)
+    ndays = len(forcing)
+
+    if out is None:
+        out = np.zeros((ndays, n), dtype)
+    elif out.shape != (ndays, n):
+        raise ValueError(f"`out` must have shape {(ndays, n)}")
+
+    bounds = [(i, min(i + chunk_size, n)) for i in range(0, n, chunk_size)]
+
+    if processes == 1:
+        for start, stop in bounds:
+            out[:, start:stop] = _hymod_ensemble_chunk(
+                param_values[start:stop], forcing, Nq, ndays, out.dtype, state_dtype
+            )
+        return out
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(
+                _hymod_ensemble_chunk,
+                param_values[start:stop],
+                forcing,
+                Nq,
+                ndays,
+                out.dtype,
+                state_dtype,
+            ): (start, stop)
+            for start, stop in bounds
+        }
+
+        for future in concurrent.futures.as_completed(futures):
+            start, stop = futures.pop(future)
+            out[:, start:stop] = future.result()
+
+    return out
+
+
+class HymodSimulationStore:
+    """Simulated flows of a HYMOD ensemble kept on disk as a memory-mapped array.
+
+    The flows are stored in a ``.npy`` file of shape (ndays, n) and the parameter sample, SALib
+    problem and dates in a JSON sidecar of the same name.  Create a store with `create`, fill it with
+    `simulate` or `write_chunks`, and reopen it later with `open`; slicing `flows` then only reads the
+    days and samples that are touched.
+
+    :param path:                Path of the ``.npy`` file
+    :param flows:               The array of simulated flows, usually a `numpy.memmap`
+    :param params:              Array of shape (n, 5) with columns ordered as `HYMOD_PARAMETERS`
+    :param problem:             Optional SALib problem dictionary the sample was drawn from
+    :param dates:               Optional dates of the simulated days
+
+    """
+
+    def __init__(self, path, flows, params, problem=None, dates=None):
+
+        self.path = path
+        self.flows = flows
+        self.params = params
+        self.problem = problem
+        self.dates = dates
+
+    @staticmethod
+    def _paths(path):
+        """Return the array and sidecar paths for a store path with or without the .npy suffix."""
+
+        root, ext = os.path.splitext(str(path))
+        if ext != ".npy":
+            root = str(path)
+
+        return root + ".npy", root + ".json"
+
+    @classmethod
+    def create(cls, path, param_values, ndays, problem=None, dates=None, dtype=np.float64):
+        """Create a store of zeros on disk, writing the sidecar and sizing the array up front.
+
+        :param path:                Path of the ``.npy`` file; the suffix is added if missing
+        :param param_values:        Sample matrix of shape (n, 5); when `problem` is given its columns
+                                    are ordered as `problem["names"]`, otherwise as
+                                    `HYMOD_PARAMETERS`
+        :param ndays:               Number of simulated days
+        :param problem:             Optional SALib problem dictionary
+        :param dates:               Optional sequence of `ndays` dates
+        :param dtype:               Data type of the stored flows
+
+        :return:                    A writable `HymodSimulationStore`
+
+        """
+        array_path, sidecar_path = cls._paths(path)
+
+        if problem is None:
+            params = np.atleast_2d(np.asarray(param_values, dtype=np.float64))
+        else:
+            params = _order_parameters(problem, param_values)
+
+        if dates is not None:
+            dates = pd.DatetimeIndex(dates)
+            if len(dates) != ndays:
+                raise ValueError(f"`dates` has {len(dates)} entries but `ndays` is {ndays}")
+
+        sidecar = {
+            "names": list(HYMOD_PARAMETERS),
+            "params": params.tolist(),
+            "problem": None if problem is None else _json_problem(problem),
+            "dates": None if dates is None else [i.isoformat() for i in dates],
+        }
+
+        with open(sidecar_path, "w") as f:
+            json.dump(sidecar, f)
+
+        flows = np.lib.format.open_memmap(
+            array_path, mode="w+", dtype=dtype, shape=(ndays, params.shape[0])
+        )
+
+        return cls(array_path, flows, params, problem, dates)
+
+    @classmethod
+    def open(cls, path, mmap_mode="r"):
+        """Open an existing store without reading the flows into memory.
+
+        :param path:                Path of the ``.npy`` file; the suffix is added if missing
+        :param mmap_mode:           Memory-map mode passed to `numpy.load`; use "r+" to keep writing
+
+        :return:                    A `HymodSimulationStore`
+
+        """
+        array_path, sidecar_path = cls._paths(path)
+
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+
+        flows = np.load(array_path, mmap_mode=mmap_mode)
+        dates = None if sidecar["dates"] is None else pd.DatetimeIndex(sidecar["dates"])
+
+        return cls(array_path, flows, np.array(sidecar["params"]), sidecar["problem"], dates)
+
+    def __len__(self):
+        return self.flows.shape[0]
+
+    def window(self, start=None, stop=None):
+        """Return the flows between two dates, inclusive, as a view of the stored array."""
+
+        if self.dates is None:
+            raise ValueError("The store has no dates")
+
+        return self.flows[self.dates.slice_indexer(start, stop)]
+
+    def simulate(self, forcing, Nq=3, processes=None, chunk_size=256, state_dtype=np.float64):
+        """Run every parameter set with `simulate_hymod_sample`, writing chunks as they finish.
+
+        :param forcing:             A `HymodForcing` or dataframe covering at least the stored days
+        :param Nq:                  number of quickflow routing tanks
+        :param processes:           Number of worker processes
+        :param chunk_size:          Number of parameter sets simulated per task
+        :param state_dtype:         Data type used to accumulate the model states
+
+        :return:                    The stored flows
+
+        """
+        simulate_hymod_sample(
+            self.params,
+            forcing,
+            Nq=Nq,
+            ndays=len(self),
+            processes=processes,
+            chunk_size=chunk_size,
+            out=self.flows,
+            state_dtype=state_dtype,
+        )
+        self.flush()
+
+        return self.flows
+
+    def write_chunks(self, chunks, key="Q"):
+        """Write consecutive time chunks, e.g. from `iter_hymod_ensemble`, into the store.
+
+        :param chunks:              Iterable of output dictionaries covering the record in order
+        :param key:                 Name of the output to store
+
+        :return:                    The number of days written
+
+        """
+        day = 0
+
+        for results in chunks:
+            arr = results[key]
+            self.flows[day : day + len(arr)] = arr
+            day += len(arr)
+
+        self.flush()
+
+        return day
+
+    def flush(self):
+        """Write any pending changes of a memory-mapped store to disk."""
+
+        if isinstance(self.flows, np.memmap):
+            self.flows.flush()
+
+
+def _json_problem(problem):
+    """Return a copy of a SALib problem dictionary with arrays converted to lists for JSON."""
+
+    return {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in problem.items()}
+
+
+def hymod_sobol(
+    problem,
+    param_values,
+    forcing,
+    Nq=3,
+    ndays=None,
+    metric=None,
+    processes=None,
+    chunk_size=256,
+    **kwargs,
+):
+    """Run a HYMOD Sobol sensitivity analysis for a SALib problem and Saltelli sample.
+
+    :param problem:             SALib problem dictionary whose names are the HYMOD parameters
+    :type problem:              dict
+
+    :param param_values:        Saltelli sample matrix with columns ordered as `problem["names"]`,
+                                e.g. from `load_hymod_params()`
+    :type param_values:         numpy.ndarray
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data
+    :param Nq:                  number of quickflow routing tanks
+    :type Nq:                   int
+
+    :param ndays:               The number of days to process from the beginning of the record
+    :type ndays:                int
+
+    :param metric:              Callable reducing the (ndays, n) flow array to one value per sample;
+                                defaults to the mean flow of each sample
+    :param processes:           Number of worker processes passed to `simulate_hymod_sample`
+    :type processes:            int
+
+    :param chunk_size:          Number of parameter sets simulated per task
+    :type chunk_size:           int
+
+    :param kwargs:              Additional keyword arguments passed to `SALib.analyze.sobol.analyze`
+
+    :return:                    SALib result dictionary of sensitivity indices
+
+    """
+    params = _order_parameters(problem, param_values)
+
+    Q = simulate_hymod_sample(
+        params, forcing, Nq=Nq, ndays=ndays, processes=processes, chunk_size=chunk_size
+    )
+
+    Y = Q.mean(axis=0) if metric is None else np.asarray(metric(Q))
+
+    kwargs.setdefault("print_to_console", False)
+
+    return sobol.analyze(problem, Y, **kwargs)
+
+
+# likelihood measures available to `glue` by name, with whether larger values are better
+GLUE_LIKELIHOODS = {"nse": (nse, True), "kge": (kge, True), "mse": (mse, False)}
+
+
+def glue(
+    forcing,
+    problem=None,
+    n_samples=None,
+    param_values=None,
+    likelihood="nse",
+    threshold=None,
+    top_k=None,
+    maximize=True,
+    Nq=3,
+    ndays=None,
+    warmup_days=0,
+    batch_size=1000,
+    keep_flows=True,
+    seed=None,
+):
+    """GLUE / pre-calibration of HYMOD with behavioral filtering applied batch by batch.
+
+    Parameter sets are simulated in batches with `hymod_ensemble` and scored against the observed
+    streamflow as they are produced.  Only behavioral runs are kept: those passing `threshold`
+    and, if `top_k` is set, the best `top_k` runs seen so far.  Non-behavioral trajectories are
+    discarded with their batch.
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data including Strmflw
+    :param problem:             SALib-style problem dictionary whose bounds are sampled uniformly
+                                when `param_values` is not given
+    :type problem:              dict
+
+    :param n_samples:           Number of parameter sets to sample from `problem`
+    :type n_samples:            int
+
+    :param param_values:        Optional sample matrix with columns ordered as `problem["names"]`, or
+                                as `HYMOD_PARAMETERS` when no problem is given
+    :param likelihood:          Name from `GLUE_LIKELIHOODS` or a callable mapping (ndays, n)
+                                simulations and (ndays,) observations to n scores
+    :param threshold:           Behavioral threshold on the likelihood measure
+    :type threshold:            float
+
+    :param top_k:               Keep at most this many of the best runs
+    :type top_k:                int
+
+    :param maximize:            Whether larger values of a callable `likelihood` are better
+    :type maximize:             bool
+
+    :param Nq:                  number of quickflow routing tanks
+    :param ndays:               The number of days to process from the beginning of the record
+    :param warmup_days:         Number of leading days excluded from scoring
+    :param batch_size:          Number of parameter sets simulated at once
+    :param keep_flows:          If True, also keep the simulated flow of the behavioral runs
+    :param seed:                Seed for sampling `problem`
+
+    :return:                    A dictionary of behavioral `params` (columns ordered as
+                                `HYMOD_PARAMETERS`), their `scores` and, if requested, their flows
+                                `Q` with shape (ndays, k), sorted from best to worst, along with
+                                the number of runs evaluated in `n_evaluated`
+
+    """
+    if threshold is None and top_k is None:
+        raise ValueError("At least one of `threshold` or `top_k` is required")
+
+    if isinstance(likelihood, str):
+        likelihood, maximize = GLUE_LIKELIHOODS[likelihood.lower()]
+
+    forcing = as_hymod_forcing(forcing, ndays)
+
+    if forcing.strmflw is None:
+        raise ValueError("The forcing must include observed streamflow (Strmflw)")
+
+    obs = forcing.strmflw[warmup_days:]
+
+    if param_values is None:
+        if problem is None or n_samples is None:
+            raise ValueError("Either `param_values` or both `problem` and `n_samples` are required")
+        bounds = np.asarray(problem["bounds"], dtype=np.float64)
+        rng = np.random.default_rng(seed)
+        param_values = bounds[:, 0] + rng.random((n_samples, len(bounds))) * np.ptp(bounds, axis=1)
+
+    if problem is not None:
+        params = _order_parameters(problem, param_values)
+    else:
+        params = np.atleast_2d(np.asarray(param_values, dtype=np.float64))
+
+    # behavioral buffer; scores are stored so that larger is always better
+    kept_params = np.zeros((0, params.shape[1]))
+    kept_scores = np.zeros(0)
+    kept_flows = np.zeros((len(forcing), 0))
+    sign = 1 if maximize else -1
+
+    for start in range(0, len(params), batch_size):
+        batch = params[start : start + batch_size]
+        Q = hymod_ensemble(batch, forcing, Nq=Nq, outputs=["Q"])["Q"]
+        scores = sign * np.asarray(likelihood(Q[warmup_days:], obs), dtype=np.float64)
+
+        behavioral = np.isfinite(scores)
+        if threshold is not None:
+            behavioral &= scores >= sign * threshold
+
+        kept_params = np.concatenate([kept_params, batch[behavioral]])
+        kept_scores = np.concatenate([kept_scores, scores[behavioral]])
+        if keep_flows:
+            kept_flows = np.concatenate([kept_flows, Q[:, behavioral]], axis=1)
+
+        if top_k is not None and len(kept_scores) > top_k:
+            best = np.argsort(-kept_scores, kind="stable")[:top_k]
+            kept_params, kept_scores = kept_params[best], kept_scores[best]
+            if keep_flows:
+                kept_flows = kept_flows[:, best]
+
+    order = np.argsort(-kept_scores, kind="stable")
+
+    results = {
+        "params": kept_params[order],
+        "scores": sign * kept_scores[order],
+        "n_evaluated": len(params),
+    }
+
+    if keep_flows:
+        results["Q"] = kept_flows[:, order]
+
+    return results
+
+
+def _window_weights(dates, window):
+    """Return window labels and a (n_windows, ndays) matrix averaging the days of each window."""
+
+    dates = pd.DatetimeIndex(dates)
+
+    if window == "month":
+        labels, index = np.unique(dates.month, return_inverse=True)
+        members = index[None, :] == np.arange(len(labels))[:, None]
+
+    elif window == "year":
+        labels, index = np.unique(dates.year, return_inverse=True)
+        members = index[None, :] == np.arange(len(labels))[:, None]
+
+    elif isinstance(window, (int, np.integer)) and window > 0:
+        # rolling windows of `window` consecutive calendar months, stepping one month at a time
+        periods = dates.to_period("M")
+        months, index = np.unique(periods, return_inverse=True)
+        starts = np.arange(len(months) - window + 1)
+        labels = np.array([str(i) for i in months[starts]])
+        members = (index[None, :] >= starts[:, None]) & (index[None, :] < starts[:, None] + window)
+
+    else:
+        raise ValueError("`window` must be 'month', 'year' or a positive number of months")
+
+    return labels, members / members.sum(axis=1, keepdims=True)
+
+
+# number of resampled values per array held at once by the Sobol bootstrap in `_sobol_windows`
+_SOBOL_BOOTSTRAP_SIZE = 2**22
+
+
+def _sobol_windows(Y, D, calc_second_order, num_resamples, conf_level, seed):
+    """First and total order Sobol indices for every row of Y with one bootstrap shared by all rows.
+
+    Uses the same estimators and output normalization as `SALib.analyze.sobol`.
+
+    """
+    step = 2 * D + 2 if calc_second_order else D + 2
+    N = Y.shape[1] // step
+
+    if Y.shape[1] != N * step:
+        raise ValueError(
+            "Incorrect number of samples; confirm that calc_second_order matches the sampling"
+        )
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        Y = (Y - Y.mean(axis=1, keepdims=True)) / Y.std(axis=1, keepdims=True)
+    Y = np.nan_to_num(Y)
+
+    A = Y[:, 0::step]
+    B = Y[:, step - 1 :: step]
+
+    r = np.random.default_rng(seed).integers(N, size=(N, num_resamples))
+    Z = norm.ppf(0.5 + conf_level / 2)
+
+    var = np.concatenate([A, B], axis=1).var(axis=1)
+    constant = np.ptp(np.concatenate([A, B], axis=1), axis=1) == 0
+
+    S = {key: np.zeros((len(Y), D)) for key in ("S1", "S1_conf", "ST", "ST_conf")}
+
+    # resample a block of windows at a time so the (windows, N, num_resamples) arrays stay bounded
+    block = max(1, _SOBOL_BOOTSTRAP_SIZE // r.size)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for j in range(D):
+            AB = Y[:, j + 1 :: step]
+
+            S["S1"][:, j] = np.mean(B * (AB - A), axis=1) / var
+            S["ST"][:, j] = 0.5 * np.mean((A - AB) ** 2, axis=1) / var
+
+        for start in range(0, len(Y), block):
+            rows = slice(start, start + block)
+            A_r, B_r = A[rows][:, r], B[rows][:, r]
+            var_r = np.concatenate([A_r, B_r], axis=1).var(axis=1)
+
+            for j in range(D):
+                AB_r = Y[rows, j + 1 :: step][:, r]
+
+                S1_r = np.mean(B_r * (AB_r - A_r), axis=1) / var_r
+                ST_r = 0.5 * np.mean((A_r - AB_r) ** 2, axis=1) / var_r
+
+                S["S1_conf"][rows, j] = Z * S1_r.std(axis=1, ddof=1)
+                S["ST_conf"][rows, j] = Z * ST_r.std(axis=1, ddof=1)
+
+    for value in S.values():
+        value[constant] = 0.0
+
+    return S
+
+
+def _delta_window(problem, X, Y, num_resamples, conf_level, seed):
+    """Worker for `time_varying_sensitivity`; runs the delta method on one window."""
+
+    Si = delta.analyze(problem, X, Y, num_resamples=num_resamples, conf_level=conf_level, seed=seed)
+
+    return Si["delta"], Si["delta_conf"], Si["S1"], Si["S1_conf"]
+
+
+def time_varying_sensitivity(
+    problem,
+    param_values,
+    sim,
+    dates,
+    window="month",
+    methods=("sobol", "delta"),
+    calc_second_order=True,
+    num_resamples=100,
+    conf_level=0.95,
+    processes=None,
+    seed=None,
+):
+    """Sensitivity indices of mean simulated flow for every window of a time specification.
+
+    Generates the arrays behind `plot_monthly_heatmap`, `plot_annual_heatmap` and
+    `plot_varying_heatmap`.  Sobol first and total order indices are computed for all windows in
+    one vectorized pass that shares a single set of bootstrap resamples across windows; delta
+    indices are computed per window over a process pool.
+
+    :param problem:             SALib problem dictionary
+    :type problem:              dict
+
+    :param param_values:        Sample matrix used to produce `sim`, e.g. from `load_hymod_params()`
+    :type param_values:         numpy.ndarray
+
+    :param sim:                 Simulated flow with shape (ndays, nsamples), e.g. from
+                                `simulate_hymod_sample`
+    :type sim:                  numpy.ndarray
+
+    :param dates:               Date of each simulated day
+    :param window:              'month' for calendar months pooled across years, 'year' for each
+                                year, or an integer N for rolling windows of N consecutive months
+                                (N=1 gives the time-varying monthly analysis)
+    :param methods:             Any of 'sobol' (requires a Saltelli sample) and 'delta'
+    :type methods:              tuple
+
+    :param calc_second_order:   Whether the Saltelli sample was generated for second order indices
+    :param num_resamples:       Number of bootstrap resamples
+    :param conf_level:          Confidence interval level
+    :param processes:           Number of worker processes for the delta method; 1 runs in the
+                                calling process and None uses one worker per CPU
+    :param seed:                Seed for the bootstrap resamples
+
+    :return:                    A dictionary holding the window `labels` and, for each method, arrays
+                                of shape (n_windows, num_vars): S1, S1_conf, ST and ST_conf for
+                                'sobol' and delta, delta_conf, delta_S1 and delta_S1_conf for 'delta'
+
+    """
+    unknown = [i for i in methods if i not in ("sobol", "delta")]
+    if unknown:
+        raise ValueError(f"Unknown sensitivity methods {unknown}; choose from ('sobol', 'delta')")
+
+    sim = np.asarray(sim, dtype=np.float64)
+    param_values = np.asarray(param_values, dtype=np.float64)
+
+    if sim.shape[0] != len(dates) or sim.shape[1] != len(param_values):
+        raise ValueError("`sim` must have shape (len(dates), len(param_values))")
+
+    labels, weights = _window_weights(dates, window)
+
+    # mean flow of every sample in every window
+    Y = weights @ sim
+
+    results = {"labels": labels}
+    D = len(problem["names"])
+
+    if "sobol" in methods:
+        results.update(_sobol_windows(Y, D, calc_second_order, num_resamples, conf_level, seed))
+
+    if "delta" in methods:
+        args = [(problem, param_values, y, num_resamples, conf_level, seed) for y in Y]
+
+        if processes == 1:
+            values = [_delta_window(*i) for i in args]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+                values = list(executor.map(_delta_window, *zip(*args)))
 
-    results = Hymod01(data, pars, init)
+        for key, value in zip(("delta", "delta_conf", "delta_S1", "delta_S1_conf"), zip(*values)):
+            results[key] = np.array(value)
 
     return results
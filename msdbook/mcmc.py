@@ -0,0 +1,519 @@
+import json
+import os
+
+import numpy as np
+from scipy import stats
+
+from msdbook.hymod import HYMOD_PARAMETERS, as_hymod_forcing, hymod_ensemble
+from msdbook.utils import atomic_savez
+
+
+# parameter vector order used by `HymodLogPosterior`; beta and sigma define the residual model
+HYMOD_MCMC_PARAMETERS = HYMOD_PARAMETERS + ("beta", "sigma")
+
+
+class HymodLogPosterior:
+    """Batched log-posterior of HYMOD under the log-normal residual model used in 'mcmc.ipynb'.
+
+    Residuals are ``log(Strmflw) - log(Q + beta)`` and are assumed normal with standard deviation
+    ``sigma``.  Calling the object with an (n, 7) array of parameter vectors, ordered as
+    `HYMOD_MCMC_PARAMETERS`, returns the n log-posterior values while simulating HYMOD once for
+    all vectors with a finite prior density.
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data including Strmflw
+    :param priors:              Seven frozen scipy distributions ordered as `HYMOD_MCMC_PARAMETERS`
+    :type priors:               list
+
+    :param Nq:                  number of quickflow routing tanks
+    :type Nq:                   int
+
+    :param ndays:               The number of days to process from the beginning of the record
+    :type ndays:                int
+
+    """
+
+    def __init__(self, forcing, priors, Nq=3, ndays=None):
+
+        self.forcing = as_hymod_forcing(forcing, ndays)
+
+        if self.forcing.strmflw is None:
+            raise ValueError("The forcing must include observed streamflow (Strmflw)")
+
+        self.priors = list(priors)
+
+        if len(self.priors) != len(HYMOD_MCMC_PARAMETERS):
+            raise ValueError(
+                f"Expected {len(HYMOD_MCMC_PARAMETERS)} priors ordered as {HYMOD_MCMC_PARAMETERS}"
+            )
+
+        self.log_obs = np.log(self.forcing.strmflw)
+        self.Nq = Nq
+
+    def log_prior(self, params):
+        """Return the log-prior density of each row of `params`."""
+
+        params = np.atleast_2d(params)
+
+        return sum(prior.logpdf(params[:, i]) for i, prior in enumerate(self.priors))
+
+    def __call__(self, params):
+
+        params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+        lp = np.asarray(self.log_prior(params), dtype=np.float64)
+
+        # only evaluate the model where the log-prior > -Inf
+        valid = np.isfinite(lp)
+
+        if valid.any():
+            Q = hymod_ensemble(params[valid, :5], self.forcing, Nq=self.Nq, outputs=["Q"])["Q"]
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                residuals = self.log_obs[:, None] - np.log(Q + params[valid, 5])
+                lp[valid] += stats.norm.logpdf(residuals, scale=params[valid, 6]).sum(axis=0)
+
+        return np.where(np.isnan(lp), -np.inf, lp)
+
+
+class _LogHistogramQuantiles:
+    """Streaming per-day quantile estimator built on fixed histogram bins in log space.
+
+    Memory is O(ndays * n_bins) whatever the number of samples.  Non-positive values are counted
+    separately as zeros, positive values outside the bounds fall in the edge bins, and NaN or
+    infinite values are left out of the day's sample.
+
+    """
+
+    def __init__(self, ndays, lower, upper, n_bins):
+
+        self.ndays = ndays
+        self.n_bins = n_bins
+        self.log_lower = np.log(lower)
+        self.width = (np.log(upper) - self.log_lower) / n_bins
+        self.counts = np.zeros((ndays, n_bins), dtype=np.int64)
+        self.zeros = np.zeros(ndays, dtype=np.int64)
+        self.n = np.zeros(ndays, dtype=np.int64)
+
+    def update(self, values):
+        """Add a (ndays, batch) array of samples."""
+
+        finite = np.isfinite(values)
+        positive = finite & (values > 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bins = np.floor((np.log(np.where(positive, values, 1)) - self.log_lower) / self.width)
+
+        bins = np.clip(bins, 0, self.n_bins - 1).astype(np.int64)
+        flat = (np.arange(self.ndays)[:, None] * self.n_bins + bins)[positive]
+
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        self.zeros += finite.sum(axis=1) - positive.sum(axis=1)
+        self.n += finite.sum(axis=1)
+
+    def quantiles(self, q):
+        """Return an array of shape (len(q), ndays) of interpolated quantiles; NaN without samples."""
+
+        cum = self.zeros[:, None] + np.cumsum(self.counts, axis=1)
+        rows = np.arange(self.ndays)
+        out = np.zeros((len(q), self.ndays))
+
+        for i, target in enumerate(np.asarray(q)[:, None] * self.n):
+            k = np.argmax(cum >= target[:, None], axis=1)
+            below = np.where(k > 0, cum[rows, np.maximum(k - 1, 0)], self.zeros)
+            frac = (target - below) / np.maximum(self.counts[rows, k], 1)
+            value = np.exp(self.log_lower + (k + np.clip(frac, 0, 1)) * self.width)
+            out[i] = np.where(self.n == 0, np.nan, np.where(target <= self.zeros, 0.0, value))
+
+        return out
+
+
+def _predictive_flow(params, forcing, Nq, noise, rng):
+    """Simulate HYMOD for a batch of parameter vectors and add the log-normal residual noise."""
+
+    Q = hymod_ensemble(params[:, :5], forcing, Nq=Nq, outputs=["Q"])["Q"]
+
+    if not noise:
+        return Q
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_flow = np.log(Q + params[:, 5]) + rng.standard_normal(Q.shape) * params[:, 6]
+
+    return np.exp(log_flow)
+
+
+def _stream_quantiles(batches, forcing, quantiles, Nq, ndays, noise, n_bins, bounds, rng):
+    """Fold the simulated flows of each batch of parameter vectors into a quantile estimator."""
+
+    forcing = as_hymod_forcing(forcing, ndays)
+    estimator = None
+
+    for params in batches:
+        flow = _predictive_flow(params, forcing, Nq, noise, rng)
+
+        if estimator is None:
+            if bounds is None:
+                positive = flow[np.isfinite(flow) & (flow > 0)]
+                if positive.size:
+                    bounds = (positive.min() / 100, positive.max() * 100)
+                else:
+                    bounds = (1e-6, 1e6)
+            estimator = _LogHistogramQuantiles(len(forcing), bounds[0], bounds[1], n_bins)
+
+        estimator.update(flow)
+
+    if estimator is None:
+        raise ValueError("No parameter vectors were provided")
+
+    return estimator.quantiles(quantiles)
+
+
+def predictive_quantiles(
+    params,
+    forcing,
+    quantiles=(0.05, 0.5, 0.95),
+    Nq=3,
+    ndays=None,
+    noise=True,
+    batch_size=100,
+    n_bins=2000,
+    bounds=None,
+    seed=None,
+):
+    """Per-day predictive quantiles of HYMOD streamflow for a sample of parameter vectors.
+
+    Parameter vectors are simulated in batches with `hymod_ensemble` and each batch is folded into
+    a log-space histogram per day, so the (ndays, nsamples) flow matrix is never held in memory.
+    Quantiles follow the inverted-CDF definition and are accurate to about
+    ``exp((log(upper) - log(lower)) / n_bins) - 1`` in relative terms for values inside `bounds`.
+
+    :param params:              Array of shape (nsamples, 7) ordered as `HYMOD_MCMC_PARAMETERS`,
+                                e.g. posterior draws; beta and sigma may be omitted if `noise` is
+                                False
+    :type params:               numpy.ndarray
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data
+    :param quantiles:           Quantile levels to return
+    :param Nq:                  number of quickflow routing tanks
+    :param ndays:               The number of days to process from the beginning of the record
+    :param noise:               If True, add the log-normal residual noise defined by beta and sigma
+    :param batch_size:          Number of parameter vectors simulated at once
+    :param n_bins:              Number of histogram bins per day
+    :param bounds:              (lower, upper) range of the histogram; defaults to the range of the
+                                first batch widened by a factor of 100 on each side
+    :param seed:                Seed for the residual noise
+
+    :return:                    Array of shape (len(quantiles), ndays)
+
+    """
+    params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+    batches = (params[i : i + batch_size] for i in range(0, len(params), batch_size))
+
+    return _stream_quantiles(
+        batches, forcing, quantiles, Nq, ndays, noise, n_bins, bounds, np.random.default_rng(seed)
+    )
+
+
+def prior_predictive_quantiles(
+    priors,
+    forcing,
+    nsamples,
+    quantiles=(0.05, 0.5, 0.95),
+    Nq=3,
+    ndays=None,
+    noise=True,
+    batch_size=100,
+    n_bins=2000,
+    bounds=None,
+    seed=None,
+):
+    """Per-day prior-predictive quantiles of HYMOD streamflow.
+
+    Parameter vectors are drawn from `priors` one batch at a time and passed through
+    `predictive_quantiles`, so neither the prior sample nor the simulated flows are held in full.
+
+    :param priors:              Frozen scipy distributions ordered as `HYMOD_MCMC_PARAMETERS`; the
+                                beta and sigma priors may be omitted if `noise` is False
+    :type priors:               list
+
+    :param forcing:             A `HymodForcing` or dataframe of hymod data
+    :param nsamples:            Number of prior draws
+    :type nsamples:             int
+
+    :param seed:                Seed for the prior draws and the residual noise
+
+    The remaining arguments are described in `predictive_quantiles`.
+
+    :return:                    Array of shape (len(quantiles), ndays)
+
+    """
+    n_params = len(HYMOD_MCMC_PARAMETERS) if noise else len(HYMOD_PARAMETERS)
+
+    if len(priors) < n_params:
+        raise ValueError(f"Expected {n_params} priors ordered as {HYMOD_MCMC_PARAMETERS}")
+
+    rng = np.random.default_rng(seed)
+
+    # draw the prior sample lazily, one batch at a time
+    batches = (
+        np.column_stack(
+            [p.rvs(min(batch_size, nsamples - i), random_state=rng) for p in priors[:n_params]]
+        )
+        for i in range(0, nsamples, batch_size)
+    )
+
+    return _stream_quantiles(batches, forcing, quantiles, Nq, ndays, noise, n_bins, bounds, rng)
+
+
+def _load_checkpoint(path):
+    """Read a sampler state written by `metropolis`."""
+
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def metropolis(
+    log_posterior,
+    p0,
+    n_iter,
+    proposal_sd=None,
+    proposal_cov=None,
+    thin=1,
+    adapt_start=None,
+    adapt_interval=100,
+    seed=None,
+    checkpoint=None,
+    checkpoint_interval=1000,
+):
+    """Random-walk Metropolis sampler running many independent chains in lockstep.
+
+    Every iteration proposes one move per chain and evaluates `log_posterior` once for the whole
+    batch of proposals, so batched posteriors such as `HymodLogPosterior` simulate all chains
+    together.  With `adapt_start` set, the proposal covariance is replaced every `adapt_interval`
+    iterations by the scaled covariance of the draws pooled across chains (Haario et al., 2001).
+
+    :param log_posterior:       Callable mapping an (n_chains, n_params) array to n_chains
+                                log-posterior values
+    :param p0:                  Initial parameter vectors with shape (n_chains, n_params)
+    :type p0:                   numpy.ndarray
+
+    :param n_iter:              Total number of iterations per chain
+    :type n_iter:               int
+
+    :param proposal_sd:         Proposal standard deviation of each parameter
+    :param proposal_cov:        Proposal covariance matrix; used instead of `proposal_sd` if given
+    :param thin:                Keep every `thin` th draw
+    :type thin:                 int
+
+    :param adapt_start:         Iteration after which the proposal covariance is adapted; None
+                                keeps the proposal fixed
+    :type adapt_start:          int
+
+    :param adapt_interval:      Number of iterations between covariance updates
+    :type adapt_interval:       int
+
+    :param seed:                Seed for the random number generator
+    :type seed:                 int
+
+    :param checkpoint:          Path of an `.npz` checkpoint file.  If the file exists the run is
+                                resumed from it, and the sampler state is written to it every
+                                `checkpoint_interval` iterations and at the end of the run.  A
+                                checkpoint beyond `n_iter` iterations raises a ValueError.
+    :type checkpoint:           str
+
+    :param checkpoint_interval: Number of iterations between checkpoints
+    :type checkpoint_interval:  int
+
+    :return:                    A dictionary of kept `samples` with shape (n_kept, n_chains,
+                                n_params), their `log_posterior` values, the per-chain
+                                `accept_rate` and the final `proposal_cov`
+
+    """
+    p0 = np.atleast_2d(np.asarray(p0, dtype=np.float64))
+    n_chains, n_params = p0.shape
+    n_kept = n_iter // thin
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        state = _load_checkpoint(checkpoint)
+
+        if int(state["thin"]) != thin or state["current"].shape != p0.shape:
+            raise ValueError(f"The checkpoint {checkpoint} does not match the requested run")
+
+        rng = np.random.default_rng()
+        rng.bit_generator.state = json.loads(str(state["rng_state"]))
+
+        start = int(state["iteration"])
+
+        if start > n_iter:
+            raise ValueError(
+                f"The checkpoint {checkpoint} is at iteration {start}, beyond n_iter={n_iter}"
+            )
+
+        current = state["current"]
+        current_lp = state["current_lp"]
+        accepted = state["accepted"]
+        cov = state["proposal_cov"]
+        mean, m2, count = state["mean"], state["m2"], int(state["count"])
+
+        saved = len(state["samples"])
+        samples = np.zeros((max(n_kept, saved), n_chains, n_params))
+        lps = np.zeros((max(n_kept, saved), n_chains))
+        samples[:saved] = state["samples"]
+        lps[:saved] = state["log_posterior"]
+
+    else:
+        if proposal_cov is not None:
+            cov = np.asarray(proposal_cov, dtype=np.float64)
+        elif proposal_sd is not None:
+            cov = np.diag(np.square(np.asarray(proposal_sd, dtype=np.float64)))
+        else:
+            raise ValueError("One of `proposal_sd` or `proposal_cov` is required")
+
+        rng = np.random.default_rng(seed)
+
+        start = 0
+        current = p0.copy()
+        current_lp = np.asarray(log_posterior(current), dtype=np.float64)
+        accepted = np.zeros(n_chains)
+
+        # running pooled moments of the draws for covariance adaptation
+        mean = np.zeros(n_params)
+        m2 = np.zeros((n_params, n_params))
+        count = 0
+
+        samples = np.zeros((n_kept, n_chains, n_params))
+        lps = np.zeros((n_kept, n_chains))
+
+    chol = np.linalg.cholesky(cov)
+
+    def _state(iteration):
+        kept = iteration // thin
+        return {
+            "samples": samples[:kept],
+            "log_posterior": lps[:kept],
+            "current": current,
+            "current_lp": current_lp,
+            "accepted": accepted,
+            "proposal_cov": cov,
+            "mean": mean,
+            "m2": m2,
+            "count": count,
+            "iteration": iteration,
+            "thin": thin,
+            "rng_state": json.dumps(rng.bit_generator.state),
+        }
+
+    for i in range(start, n_iter):
+
+        # propose and evaluate a move for every chain at once
+        proposal = current + rng.standard_normal((n_chains, n_params)) @ chol.T
+        proposal_lp = np.asarray(log_posterior(proposal), dtype=np.float64)
+
+        accept = np.log(rng.uniform(size=n_chains)) < proposal_lp - current_lp
+        current = np.where(accept[:, None], proposal, current)
+        current_lp = np.where(accept, proposal_lp, current_lp)
+        accepted += accept
+
+        # update the pooled mean and scatter matrix with this batch of draws
+        batch_mean = current.mean(axis=0)
+        centered = current - batch_mean
+        delta = batch_mean - mean
+        total = count + n_chains
+        m2 = m2 + centered.T @ centered + np.outer(delta, delta) * count * n_chains / total
+        mean = mean + delta * n_chains / total
+        count = total
+
+        if (i + 1) % thin == 0:
+            samples[(i + 1) // thin - 1] = current
+            lps[(i + 1) // thin - 1] = current_lp
+
+        if adapt_start is not None and i + 1 >= adapt_start and (i + 1) % adapt_interval == 0:
+            cov = (2.38**2 / n_params) * m2 / (count - 1) + 1e-10 * np.eye(n_params)
+            chol = np.linalg.cholesky(cov)
+
+        if checkpoint is not None and (i + 1) % checkpoint_interval == 0:
+            atomic_savez(checkpoint, **_state(i + 1))
+
+    # a checkpoint of a finished run is returned as stored
+    if checkpoint is not None and start < n_iter:
+        atomic_savez(checkpoint, **_state(n_iter))
+
+    return {
+        "samples": samples[:n_kept],
+        "log_posterior": lps[:n_kept],
+        "accept_rate": accepted / n_iter,
+        "proposal_cov": cov,
+    }
+
+
+def gelman_rubin(samples):
+    """Split R-hat convergence diagnostic for each parameter.
+
+    :param samples:             Array of draws with shape (n_draws, n_chains, n_params)
+    :type samples:              numpy.ndarray
+
+    :return:                    Array of R-hat values, one per parameter
+
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    half = samples.shape[0] // 2
+
+    # split every chain in two so that drifting chains are detected too
+    split = np.concatenate([samples[:half], samples[half : 2 * half]], axis=1)
+
+    W = split.var(axis=0, ddof=1).mean(axis=0)
+    B = half * split.mean(axis=0).var(axis=0, ddof=1)
+    var_plus = (half - 1) / half * W + B / half
+
+    return np.sqrt(var_plus / W)
+
+
+def _autocovariance(samples):
+    """Autocovariance of each chain and parameter along the first axis, computed with an FFT."""
+
+    n = samples.shape[0]
+    centered = samples - samples.mean(axis=0)
+    size = 2 ** int(np.ceil(np.log2(2 * n)))
+
+    f = np.fft.rfft(centered, n=size, axis=0)
+
+    return np.fft.irfft(f * np.conjugate(f), n=size, axis=0)[:n] / n
+
+
+def effective_sample_size(samples):
+    """Effective sample size of each parameter pooled across chains.
+
+    Uses the multi-chain autocorrelation estimate truncated with Geyer's initial positive sequence.
+
+    :param samples:             Array of draws with shape (n_draws, n_chains, n_params)
+    :type samples:              numpy.ndarray
+
+    :return:                    Array of effective sample sizes, one per parameter
+
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    n, m = samples.shape[:2]
+
+    acov = _autocovariance(samples)
+    W = (acov[0] * n / (n - 1)).mean(axis=0)
+    var_plus = W * (n - 1) / n
+    if m > 1:
+        var_plus = var_plus + samples.mean(axis=0).var(axis=0, ddof=1)
+
+    rho = 1 - (W - acov.mean(axis=1)) / var_plus
+    rho[0] = 1
+
+    ess = np.zeros(samples.shape[2])
+
+    for j in range(samples.shape[2]):
+
+        # sum consecutive pairs of autocorrelations until a pair becomes negative
+        pairs = rho[: 2 * (n // 2), j].reshape(-1, 2).sum(axis=1)
+        negative = np.nonzero(pairs < 0)[0]
+        pairs = pairs[: negative[0]] if len(negative) else pairs
+
+        # enforce a monotone sequence to reduce noise in the tail
+        pairs = np.minimum.accumulate(pairs)
+
+        tau = max(-1 + 2 * pairs.sum(), 1 / np.log10(n * m))
+        ess[j] = n * m / tau
+
+    return ess
@@ -0,0 +1,247 @@
+import numpy as np
+
+
+def _as_columns(sim, obs):
+    """Return simulations as a 2D (ndays, nsamples) array and observations as an (ndays, 1) column."""
+
+    sim = np.asarray(sim, dtype=np.float64)
+    obs = np.asarray(obs, dtype=np.float64)
+
+    if sim.ndim == 1:
+        sim = sim[:, None]
+
+    if sim.shape[0] != obs.shape[0]:
+        raise ValueError(
+            f"Simulations have {sim.shape[0]} time steps but observations have {obs.shape[0]}"
+        )
+
+    return sim, obs.reshape(-1, 1)
+
+
+def mse(sim, obs):
+    """Mean squared error of each simulation.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    return np.mean((sim - obs) ** 2, axis=0)
+
+
+def nse(sim, obs):
+    """Nash-Sutcliffe efficiency of each simulation.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    return 1 - np.sum((sim - obs) ** 2, axis=0) / np.sum((obs - obs.mean()) ** 2)
+
+
+def kge(sim, obs):
+    """Kling-Gupta efficiency of each simulation (Gupta et al., 2009).
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    sim_mean = sim.mean(axis=0)
+    sim_std = sim.std(axis=0)
+    obs_mean = obs.mean()
+    obs_std = obs.std()
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.mean((sim - sim_mean) * (obs - obs_mean), axis=0) / (sim_std * obs_std)
+
+    r = np.nan_to_num(r, nan=0.0)
+
+    return 1 - np.sqrt((r - 1) ** 2 + (sim_std / obs_std - 1) ** 2 + (sim_mean / obs_mean - 1) ** 2)
+
+
+def mae(sim, obs):
+    """Mean absolute error of each simulation.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    return np.mean(np.abs(sim - obs), axis=0)
+
+
+def rmse(sim, obs):
+    """Root mean squared error of each simulation.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    return np.sqrt(mse(sim, obs))
+
+
+def log_nse(sim, obs, eps=None):
+    """Nash-Sutcliffe efficiency of the log-transformed flows, emphasizing low-flow performance.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+    :param eps:                 Offset added before taking logs to handle zero flows; defaults to
+                                one hundredth of the mean observed flow
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    if eps is None:
+        eps = obs.mean() / 100
+
+    return nse(np.log(sim + eps), np.log(obs + eps).ravel())
+
+
+def bias(sim, obs):
+    """Mean error (simulated minus observed) of each simulation.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    return sim.mean(axis=0) - obs.mean()
+
+
+def peak_error(sim, obs):
+    """Relative error of the simulated peak flow against the observed peak flow.
+
+    :param sim:                 Simulated series with shape (ndays,) or (ndays, nsamples)
+    :param obs:                 Observed series with shape (ndays,)
+
+    :return:                    Array of shape (nsamples,)
+
+    """
+    sim, obs = _as_columns(sim, obs)
+
+    return (sim.max(axis=0) - obs.max()) / obs.max()
+
+
+# metrics computed by `skill_metrics` by name
+SKILL_METRICS = {
+    "mae": mae,
+    "mse": mse,
+    "rmse": rmse,
+    "nse": nse,
+    "kge": kge,
+    "log_nse": log_nse,
+    "bias": bias,
+    "peak_error": peak_error,
+}
+
+
+def _select_metrics(metrics):
+    """Validate a metric selection and return it as a list of names from `SKILL_METRICS`."""
+
+    if metrics is None:
+        return list(SKILL_METRICS)
+
+    if isinstance(metrics, str):
+        metrics = [metrics]
+
+    unknown = [i for i in metrics if i not in SKILL_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics {unknown}; choose from {list(SKILL_METRICS)}")
+
+    return list(metrics)
+
+
+def _iter_column_blocks(sim, chunk_size):
+    """Yield blocks of columns from an array, or the items of an iterable of column blocks."""
+
+    if hasattr(sim, "shape"):
+        if chunk_size is None or len(sim.shape) == 1:
+            yield sim
+        else:
+            for i in range(0, sim.shape[1], chunk_size):
+                yield sim[:, i : i + chunk_size]
+    else:
+        yield from sim
+
+
+def skill_metrics(sim, obs, metrics=None, chunk_size=None):
+    """Compute skill metrics of an ensemble of simulated flows against observations.
+
+    :param sim:                 Simulated flows with shape (ndays, nsamples), e.g. a memory-mapped
+                                array, or an iterable yielding (ndays, k) column blocks in order
+    :param obs:                 Observed series with shape (ndays,)
+    :param metrics:             Names from `SKILL_METRICS` to compute; defaults to all of them
+    :type metrics:              list
+
+    :param chunk_size:          If given, read `sim` in blocks of this many columns so that only one
+                                block is in memory at a time
+    :type chunk_size:           int
+
+    :return:                    A dictionary of arrays of shape (nsamples,) keyed by metric name
+
+    """
+    metrics = _select_metrics(metrics)
+    results = {name: [] for name in metrics}
+
+    for block in _iter_column_blocks(sim, chunk_size):
+        block, obs_col = _as_columns(block, obs)
+        for name in metrics:
+            results[name].append(SKILL_METRICS[name](block, obs_col.ravel()))
+
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def skill_metrics_by_window(sim, obs, labels, metrics=None, chunk_size=None):
+    """Compute skill metrics separately for each window of time, e.g. each month or year.
+
+    :param sim:                 Simulated flows with shape (ndays, nsamples) or an iterable of
+                                column blocks, as in `skill_metrics`
+    :param obs:                 Observed series with shape (ndays,)
+    :param labels:              Window label of each day with shape (ndays,), e.g.
+                                ``dates.month`` or ``dates.year``
+    :param metrics:             Names from `SKILL_METRICS` to compute; defaults to all of them
+    :param chunk_size:          If given, read `sim` in blocks of this many columns
+
+    :return:                    A tuple of the sorted unique window labels and a dictionary of
+                                arrays of shape (n_windows, nsamples) keyed by metric name
+
+    """
+    metrics = _select_metrics(metrics)
+    obs = np.asarray(obs, dtype=np.float64)
+    windows, index = np.unique(np.asarray(labels), return_inverse=True)
+    results = {name: [] for name in metrics}
+
+    for block in _iter_column_blocks(sim, chunk_size):
+        block, _ = _as_columns(block, obs)
+        scores = {name: np.zeros((len(windows), block.shape[1])) for name in metrics}
+
+        for w in range(len(windows)):
+            days = index == w
+            for name in metrics:
+                scores[name][w] = SKILL_METRICS[name](block[days], obs[days])
+
+        for name in metrics:
+            results[name].append(scores[name])
+
+    return windows, {name: np.concatenate(values, axis=1) for name, values in results.items()}
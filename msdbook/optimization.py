@@ -0,0 +1,460 @@
+import concurrent.futures
+import json
+import os
+
+import numpy as np
+
+from msdbook.generalized_fish_game import fish_game_batch
+from msdbook.utils import atomic_savez
+
+
+class EpsilonArchive:
+    """Archive of epsilon-nondominated solutions for minimization (Laumanns et al., 2002).
+
+    The objective space is divided into boxes of side `epsilons`; the archive holds at most one
+    solution per box and no solution whose box is dominated by another member's box.  Within a
+    box a dominating solution, or else the one closer to the box's lower corner, is kept.
+
+    :param epsilons:            Box size of each objective
+
+    """
+
+    def __init__(self, epsilons):
+
+        self.epsilons = np.asarray(epsilons, dtype=np.float64)
+        self.vars = None
+        self.objs = np.zeros((0, len(self.epsilons)))
+
+    def __len__(self):
+        return len(self.objs)
+
+    def add(self, vars, objs):
+        """Offer one solution to the archive.
+
+        :param vars:                Decision variables of the solution
+        :param objs:                Objective values of the solution
+
+        :return:                    True if the solution was added
+
+        """
+        vars = np.asarray(vars, dtype=np.float64)
+        objs = np.asarray(objs, dtype=np.float64)
+
+        if self.vars is None:
+            self.vars = np.zeros((0, len(vars)))
+
+        box = np.floor(objs / self.epsilons)
+        boxes = np.floor(self.objs / self.epsilons)
+        better = np.any(box < boxes, axis=1)
+        worse = np.any(box > boxes, axis=1)
+
+        # rejected if the box of any member dominates its box
+        if np.any(worse & ~better):
+            return False
+
+        same = ~better & ~worse
+        if same.any():
+            member = self.objs[same][0]
+            dominance = _pareto_compare(objs, member[None, :])[0]
+            corner = box * self.epsilons
+            closer = np.sum((objs - corner) ** 2) < np.sum((member - corner) ** 2)
+
+            if dominance > 0 or (dominance == 0 and not closer):
+                return False
+
+        keep = ~(better & ~worse) & ~same
+        self.vars = np.vstack([self.vars[keep], vars])
+        self.objs = np.vstack([self.objs[keep], objs])
+
+        return True
+
+    def extend(self, vars, objs):
+        """Offer several solutions to the archive in order."""
+
+        for v, o in zip(vars, objs):
+            self.add(v, o)
+
+
+def _pareto_compare(objs, others):
+    """Compare one objective vector against many: -1 where it dominates, 1 where dominated."""
+
+    better = np.any(objs < others, axis=1)
+    worse = np.any(objs > others, axis=1)
+
+    return np.where(better & ~worse, -1, np.where(worse & ~better, 1, 0))
+
+
+def _constrained_compare(objs, violation, others, others_violation):
+    """Pareto comparison in which a smaller total constraint violation always wins."""
+
+    result = _pareto_compare(objs, others)
+
+    return np.where(
+        violation < others_violation, -1, np.where(violation > others_violation, 1, result)
+    )
+
+
+def _as_results(results):
+    """Split the output of an evaluation function into objectives and constraint violations."""
+
+    if isinstance(results, tuple):
+        objs, cnstr = results
+        cnstr = np.asarray(cnstr, dtype=np.float64).reshape(len(objs), -1)
+        violation = np.sum(np.maximum(cnstr, 0), axis=1)
+    else:
+        objs = results
+        violation = np.zeros(len(objs))
+
+    return np.atleast_2d(np.asarray(objs, dtype=np.float64)), violation
+
+
+def _evaluate(evaluate, vars, executor=None, n_workers=1):
+    """Evaluate a batch of decision vectors, split across the workers of `executor` if given."""
+
+    if executor is None:
+        return _as_results(evaluate(vars))
+
+    # never hand a worker an empty chunk, e.g. on a final batch smaller than the pool
+    chunks = np.array_split(vars, min(n_workers, len(vars)))
+    results = [_as_results(r) for r in executor.map(evaluate, chunks)]
+
+    return np.vstack([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def _tournament(objs, violation, rng, n):
+    """Pick `n` parents by binary tournament on constrained dominance, breaking ties at random."""
+
+    a = rng.integers(len(objs), size=n)
+    b = rng.integers(len(objs), size=n)
+    coin = rng.random(n) < 0.5
+
+    winners = np.empty(n, dtype=int)
+    for i in range(n):
+        c = _constrained_compare(
+            objs[a[i]], violation[a[i]], objs[b[i], None], violation[b[i], None]
+        )[0]
+        winners[i] = a[i] if c < 0 or (c == 0 and coin[i]) else b[i]
+
+    return winners
+
+
+def _variation(parent1, parent2, bounds, rng, eta_c=15.0, eta_m=20.0):
+    """Simulated binary crossover followed by polynomial mutation, clipped to the bounds."""
+
+    lower, upper = bounds[:, 0], bounds[:, 1]
+    n, n_vars = parent1.shape
+
+    # simulated binary crossover (Deb and Agrawal, 1995), one child per pair of parents
+    u = rng.random((n, n_vars))
+    beta = np.where(
+        u <= 0.5, (2 * u) ** (1 / (eta_c + 1)), (1 / (2 * (1 - u))) ** (1 / (eta_c + 1))
+    )
+    crossover = rng.random((n, n_vars)) < 0.5
+    sign = np.where(rng.random((n, n_vars)) < 0.5, -1, 1)
+    child = np.where(
+        crossover, 0.5 * (parent1 + parent2) + sign * 0.5 * beta * (parent2 - parent1), parent1
+    )
+
+    # polynomial mutation with probability 1 / n_vars per variable
+    u = rng.random((n, n_vars))
+    delta = np.where(
+        u < 0.5, (2 * u) ** (1 / (eta_m + 1)) - 1, 1 - (2 * (1 - u)) ** (1 / (eta_m + 1))
+    )
+    mutate = rng.random((n, n_vars)) < 1 / n_vars
+    child = np.where(mutate, child + delta * (upper - lower), child)
+
+    return np.clip(child, lower, upper)
+
+
+def _update_population(pop_vars, pop_objs, pop_violation, vars, objs, violation, rng):
+    """Steady-state replacement of the epsilon-MOEA (Deb et al., 2003), modifying in place."""
+
+    c = _constrained_compare(objs, violation, pop_objs, pop_violation)
+
+    # rejected if any member dominates the child
+    if np.any(c > 0):
+        return
+
+    dominated = np.flatnonzero(c < 0)
+    i = rng.choice(dominated) if len(dominated) else rng.integers(len(pop_objs))
+
+    pop_vars[i] = vars
+    pop_objs[i] = objs
+    pop_violation[i] = violation
+
+
+def _island_epoch(
+    evaluate,
+    bounds,
+    epsilons,
+    island,
+    archive_vars,
+    archive_objs,
+    n_evals,
+    batch_size,
+    executor=None,
+    n_workers=1,
+):
+    """Advance one island by `n_evals` evaluations, starting from a copy of the global archive.
+
+    :return:                    The updated island and the vars and objectives of its archive
+
+    """
+    rng = np.random.default_rng()
+    rng.bit_generator.state = island["rng_state"]
+
+    pop_vars = island["vars"].copy()
+    pop_objs = island["objs"].copy()
+    pop_violation = island["violation"].copy()
+
+    archive = EpsilonArchive(epsilons)
+    archive.vars = archive_vars.copy()
+    archive.objs = archive_objs.copy()
+
+    done = 0
+    while done < n_evals:
+        k = min(batch_size, n_evals - done)
+
+        # one parent from the population and one from the archive while it has members
+        parent1 = pop_vars[_tournament(pop_objs, pop_violation, rng, k)]
+        if len(archive):
+            parent2 = archive.vars[rng.integers(len(archive), size=k)]
+        else:
+            parent2 = pop_vars[_tournament(pop_objs, pop_violation, rng, k)]
+
+        children = _variation(parent1, parent2, bounds, rng)
+        objs, violation = _evaluate(evaluate, children, executor, n_workers)
+
+        for i in range(k):
+            _update_population(
+                pop_vars, pop_objs, pop_violation, children[i], objs[i], violation[i], rng
+            )
+            if violation[i] == 0:
+                archive.add(children[i], objs[i])
+
+        done += k
+
+    island = {
+        "vars": pop_vars,
+        "objs": pop_objs,
+        "violation": pop_violation,
+        "rng_state": rng.bit_generator.state,
+    }
+
+    return island, archive.vars, archive.objs
+
+
+def epsilon_moea(
+    evaluate,
+    bounds,
+    epsilons,
+    n_evals,
+    population_size=100,
+    batch_size=None,
+    n_islands=1,
+    migration_interval=None,
+    processes=None,
+    seed=None,
+    snapshot=None,
+):
+    """Minimize several objectives with a batched, parallel epsilon-dominance MOEA.
+
+    Each island runs a steady-state epsilon-MOEA (Deb et al., 2003): children are bred by
+    simulated binary crossover and polynomial mutation from a tournament-selected population
+    member and an archive member, evaluated a batch at a time, and then offered to the population
+    and to an epsilon-dominance archive.  Islands evolve independently for `migration_interval`
+    evaluations between migrations; at each migration their archives are merged into the global
+    archive, which every island starts the next epoch from.
+
+    With one island the batches are split over a process pool (master-worker); with several
+    islands each island runs in its own worker.  The results do not depend on `processes`.
+
+    :param evaluate:            Picklable callable mapping an (n, n_vars) array to objectives of
+                                shape (n, n_objs) to minimize, or to a tuple of objectives and
+                                constraints of shape (n, n_cnstr) where positive values are
+                                violations, e.g. a `FishGameProblem`
+    :param bounds:              Lower and upper bound of each decision variable, shape (n_vars, 2)
+    :param epsilons:            Epsilon-box size of each objective
+    :param n_evals:             Total number of function evaluations
+    :type n_evals:              int
+
+    :param population_size:     Population size of each island
+    :type population_size:      int
+
+    :param batch_size:          Number of children evaluated together; defaults to
+                                `population_size`
+    :param n_islands:           Number of islands
+    :type n_islands:            int
+
+    :param migration_interval:  Number of evaluations per island between migrations and snapshots;
+                                defaults to 10 batches
+    :param processes:           Number of worker processes; 1 runs everything in the calling
+                                process and None uses one worker per CPU
+    :param seed:                Seed for the random number generators of the islands
+    :type seed:                 int
+
+    :param snapshot:            Path of an `.npz` snapshot file.  If the file exists the run is
+                                resumed from it, and the archive, populations and random states
+                                are written to it after every migration.
+    :type snapshot:             str
+
+    :return:                    A dictionary of the archive's decision variables `vars` and
+                                objectives `objs`, and the number of evaluations `nfe`
+
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    epsilons = np.asarray(epsilons, dtype=np.float64)
+    batch_size = population_size if batch_size is None else batch_size
+    migration_interval = 10 * batch_size if migration_interval is None else migration_interval
+    n_vars = len(bounds)
+
+    archive = EpsilonArchive(epsilons)
+    archive.vars = np.zeros((0, n_vars))
+
+    executor = None
+    if processes != 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    n_workers = processes or os.cpu_count() or 1
+
+    try:
+        if snapshot is not None and os.path.exists(snapshot):
+            with np.load(snapshot) as data:
+                state = {key: data[key] for key in data.files}
+
+            if state["vars"].shape[:2] != (n_islands, population_size) or not np.array_equal(
+                state["bounds"], bounds
+            ):
+                raise ValueError(f"The snapshot {snapshot} does not match the requested run")
+
+            archive.vars = state["archive_vars"]
+            archive.objs = state["archive_objs"]
+            rng_states = json.loads(str(state["rng_states"]))
+            islands = [
+                {
+                    "vars": state["vars"][i],
+                    "objs": state["objs"][i],
+                    "violation": state["violation"][i],
+                    "rng_state": rng_states[i],
+                }
+                for i in range(n_islands)
+            ]
+            nfe = int(state["nfe"])
+
+        else:
+            # random initial populations, evaluated together
+            seeds = np.random.SeedSequence(seed).spawn(n_islands)
+            rngs = [np.random.default_rng(s) for s in seeds]
+            vars = np.vstack(
+                [r.uniform(bounds[:, 0], bounds[:, 1], (population_size, n_vars)) for r in rngs]
+            )
+            objs, violation = _evaluate(evaluate, vars, executor, n_workers)
+
+            islands = []
+            for i, r in enumerate(rngs):
+                rows = slice(i * population_size, (i + 1) * population_size)
+                islands.append(
+                    {
+                        "vars": vars[rows],
+                        "objs": objs[rows],
+                        "violation": violation[rows],
+                        "rng_state": r.bit_generator.state,
+                    }
+                )
+
+            archive.extend(vars[violation == 0], objs[violation == 0])
+            nfe = len(vars)
+
+        while nfe < n_evals:
+            epoch = min(migration_interval, -(-(n_evals - nfe) // n_islands))
+            args = (evaluate, bounds, epsilons)
+            shared = (archive.vars, archive.objs, epoch, batch_size)
+
+            if n_islands == 1 or executor is None:
+                # a single island farms its batches out to the pool
+                pool = executor if n_islands == 1 else None
+                results = [
+                    _island_epoch(*args, island, *shared, pool, n_workers) for island in islands
+                ]
+            else:
+                futures = [
+                    executor.submit(_island_epoch, *args, island, *shared) for island in islands
+                ]
+                results = [future.result() for future in futures]
+
+            # migration: merge the island archives into the global archive
+            islands = [r[0] for r in results]
+            for _, vars, objs in results:
+                archive.extend(vars, objs)
+
+            nfe += epoch * n_islands
+
+            if snapshot is not None:
+                atomic_savez(
+                    snapshot,
+                    archive_vars=archive.vars,
+                    archive_objs=archive.objs,
+                    vars=np.stack([i["vars"] for i in islands]),
+                    objs=np.stack([i["objs"] for i in islands]),
+                    violation=np.stack([i["violation"] for i in islands]),
+                    rng_states=json.dumps([i["rng_state"] for i in islands]),
+                    bounds=bounds,
+                    nfe=nfe,
+                )
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {"vars": archive.vars, "objs": archive.objs, "nfe": nfe}
+
+
+class FishGameProblem:
+    """Fish game policy evaluation for `epsilon_moea`, simulating a batch of RBF policies at once.
+
+    Every evaluation uses the same realizations of environmental stochasticity (common random
+    numbers), so a policy always gets the same objectives.  The constraint is the mean number of
+    predator collapse days in excess of `max_collapse_days`.
+
+    :param sow:                         System parameters a, b, c, d, h, K, m, sigmaX and sigmaY
+    :param strategy:                    management strategy
+    :param N:                           Number of realizations of environmental stochasticity
+    :param tSteps:                      no. of timesteps to run the fish game on
+    :param max_collapse_days:           Allowed mean number of predator collapse days
+    :param seed:                        Seed of the stochasticity
+
+    """
+
+    def __init__(
+        self,
+        sow=(0.005, 0.5, 0.5, 0.1, 0.1, 2000, 0.7, 0.004, 0.004),
+        strategy="Previous_Prey",
+        N=100,
+        tSteps=100,
+        max_collapse_days=0,
+        seed=0,
+    ):
+
+        self.sow = np.asarray(sow, dtype=np.float64)
+        self.strategy = strategy
+        self.N = N
+        self.tSteps = tSteps
+        self.max_collapse_days = max_collapse_days
+        self.seed = seed
+
+    # C, R and W of each of the two RBFs of the harvest policy lie in [0, 1]
+    bounds = np.array([[0.0, 1.0]] * 6)
+
+    def __call__(self, vars):
+
+        objs, cnstr = fish_game_batch(
+            vars,
+            self.sow,
+            strategy=self.strategy,
+            N=self.N,
+            tSteps=self.tSteps,
+            processes=1,
+            seed=self.seed,
+            common_noise=True,
+        )
+
+        return objs[:, 0], cnstr[:, 0] - self.max_collapse_days
@@ -1,8 +1,20 @@
+import collections
+import hashlib
 import importlib.resources
+import json
+import os
 
 import numpy as np
 import pandas as pd
 
+from msdbook.utils import atomic_path
+
+
+# number of parsed datasets kept in memory by the text loaders
+DATASET_CACHE_SIZE = 16
+
+_datasets = collections.OrderedDict()
+
 
 def get_data_directory():
     """Return the directory of where the cerf package data resides."""
@@ -10,12 +22,168 @@ def get_data_directory():
     return str(importlib.resources.files("msdbook").joinpath("data"))
 
 
+def get_cache_directory():
+    """Return the directory of the binary caches of the text datasets.
+
+    Defaults to '~/.cache/msdbook' since the package data directory may be read-only; set the
+    MSDBOOK_CACHE_DIR environment variable to use another directory.
+
+    """
+
+    return os.environ.get(
+        "MSDBOOK_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "msdbook")
+    )
+
+
+def clear_dataset_cache():
+    """Drop the datasets held in memory; the binary caches on disk are kept."""
+
+    _datasets.clear()
+
+
+def _file_hash(f):
+    """Return the SHA-256 hex digest of the contents of a file."""
+
+    digest = hashlib.sha256()
+
+    with open(f, "rb") as src:
+        for block in iter(lambda: src.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _binary_cache(f, options, parse):
+    """Return the array parsed from a text file, memory-mapped from its binary cache.
+
+    The array is saved once to an '.npy' file in `get_cache_directory()` next to a JSON record of
+    the size, modification time and hash of the text file.  The cache is reused while the size and
+    modification time match, or while the hash does after the file was only touched, and rebuilt
+    otherwise.  The text is parsed directly when the cache directory is not writable.
+
+    :param f:               Path of the text file
+    :param options:         String identifying the parse options, so each gets its own cache
+    :param parse:           Function returning the parsed array; anything else it returns is
+                            passed through without caching
+
+    :return:                Read-only array
+
+    """
+
+    stat = os.stat(f)
+    key = hashlib.sha1(f"{os.path.abspath(f)}|{options}".encode()).hexdigest()[:16]
+    base = os.path.join(get_cache_directory(), f"{os.path.basename(f)}.{key}")
+    array_path, record_path = f"{base}.npy", f"{base}.json"
+
+    record = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    try:
+        with open(record_path) as src:
+            cached = json.load(src)
+        fresh = os.path.exists(array_path)
+    except (OSError, ValueError):
+        cached, fresh = {}, False
+
+    if fresh and cached.get("size") == record["size"] and cached.get("mtime") == record["mtime"]:
+        return np.load(array_path, mmap_mode="r")
+
+    record["sha256"] = _file_hash(f)
+    arr = None
+
+    # a touched but unchanged file only needs its record updated
+    if not (fresh and cached.get("sha256") == record["sha256"]):
+        arr = parse()
+        if not isinstance(arr, np.ndarray):
+            return arr
+
+    try:
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+
+        # each writer uses its own temporary files, so concurrent first loads never mix
+        if arr is not None:
+            with atomic_path(array_path, ".npy") as tmp:
+                np.save(tmp, arr)
+        with atomic_path(record_path) as tmp:
+            with open(tmp, "w") as dst:
+                json.dump(record, dst)
+
+    except OSError:
+        if arr is None:
+            return np.load(array_path, mmap_mode="r")
+        arr.flags.writeable = False
+        return arr
+
+    return np.load(array_path, mmap_mode="r")
+
+
+def _cached_dataset(kind, f, kwargs, parse):
+    """Return a parsed dataset, holding the most recently used ones in memory.
+
+    Datasets are keyed by the file, its size and modification time and the parse options, so an
+    edited file is parsed again.  Files that cannot be found are handed straight to `parse`.
+
+    """
+
+    try:
+        stat = os.stat(f)
+    except OSError:
+        return parse()
+
+    options = f"{kind}|{sorted(kwargs.items())!r}"
+    key = (f, stat.st_size, stat.st_mtime_ns, options)
+
+    if key in _datasets:
+        _datasets.move_to_end(key)
+    else:
+        _datasets[key] = _binary_cache(f, options, parse)
+        if len(_datasets) > DATASET_CACHE_SIZE:
+            _datasets.popitem(last=False)
+
+    return _datasets[key]
+
+
+def _loadtxt(f, **kwargs):
+    """Load a text file with `np.loadtxt` through the dataset caches.
+
+    The loaders built on this return the same array to every caller, so it is read-only and, when
+    the cache directory is writable, memory-mapped from the binary cache; use `np.array` on it for
+    a writable copy.
+
+    :return:                Read-only array
+
+    """
+
+    return _cached_dataset("loadtxt", f, kwargs, lambda: np.loadtxt(f, **kwargs))
+
+
+def _read_csv(f, **kwargs):
+    """Load a CSV file with `pd.read_csv` through the dataset caches.
+
+    Tables with numeric columns only are cached on disk as record arrays; others are only held in
+    memory.  Each call returns a new DataFrame.
+
+    """
+
+    def parse():
+        df = pd.read_csv(f, **kwargs)
+        if all(pd.api.types.is_numeric_dtype(i) for i in df.dtypes):
+            return df.to_records(index=False)
+        return df
+
+    table = _cached_dataset("read_csv", f, kwargs, parse)
+
+    if isinstance(table, pd.DataFrame):
+        return table.copy()
+
+    return pd.DataFrame.from_records(table)
+
+
 def load_robustness_data():
     """Load robustness solution data from file.  For use in 'fishery_dynamics.ipynb'"""
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "Robustness.txt"))
 
-    return np.loadtxt(f, delimiter=" ")
+    return _loadtxt(f, delimiter=" ")
 
 
 def load_profit_maximization_data():
@@ -23,7 +191,7 @@ def load_profit_maximization_data():
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "solutions.resultfile"))
 
-    return np.loadtxt(f)
+    return _loadtxt(f)
 
 
 def load_saltelli_param_values():
@@ -31,7 +199,7 @@ def load_saltelli_param_values():
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "param_values.csv"))
 
-    return np.loadtxt(f, delimiter=",")
+    return _loadtxt(f, delimiter=",")
 
 
 def load_collapse_data():
@@ -39,7 +207,7 @@ def load_collapse_data():
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "collapse_days.csv"))
 
-    return np.loadtxt(f, delimiter=",")
+    return _loadtxt(f, delimiter=",")
 
 
 def load_lhs_basin_sample():
@@ -47,7 +215,7 @@ def load_lhs_basin_sample():
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "LHsamples_original_1000.txt"))
 
-    return np.loadtxt(f)
+    return _loadtxt(f)
 
 
 def load_basin_param_bounds():
@@ -55,19 +223,22 @@ def load_basin_param_bounds():
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "uncertain_params_bounds.txt"))
 
-    return np.loadtxt(f, usecols=(1, 2))
+    return _loadtxt(f, usecols=(1, 2))
 
 
-def load_user_heatmap_array(user_id):
+def load_user_heatmap_array(user_id, mmap_mode=None):
     """Load the heatmap array associated with the target user ID.
 
     For use in 'basin_users_logistic_regression.ipynb'
 
+    :param user_id:         Target user ID
+    :param mmap_mode:       Optional memory-map mode passed to `np.load`
+
     """
 
     f = str(importlib.resources.files("msdbook").joinpath("data", f"{user_id}_heatmap.npy"))
 
-    return np.load(f)
+    return np.load(f, mmap_mode=mmap_mode)
 
 
 def load_user_pseudo_scores(user_id):
@@ -79,7 +250,7 @@ def load_user_pseudo_scores(user_id):
 
     f = str(importlib.resources.files("msdbook").joinpath("data", f"{user_id}_pseudo_r_scores.csv"))
 
-    return pd.read_csv(f)
+    return _read_csv(f)
 
 
 def load_hymod_input_file():
@@ -87,15 +258,19 @@ def load_hymod_input_file():
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "LeafCatch.csv"))
 
-    return pd.read_csv(f, sep=",")
+    return _read_csv(f, sep=",")
+
 
+def load_hymod_params(mmap_mode=None):
+    """Load HYMOD parameters from the Saltelli sample.  For use in 'hymod.ipynb'
 
-def load_hymod_params():
-    """Load HYMOD parameters from the Saltelli sample.  For use in 'hymod.ipynb'"""
+    :param mmap_mode:       Optional memory-map mode passed to `np.load`
+
+    """
 
     f = str(importlib.resources.files("msdbook").joinpath("data", "hymod_params_256samples.npy"))
 
-    return np.load(f)
+    return np.load(f, mmap_mode=mmap_mode)
 
 
 def load_hymod_metric_simulation():
@@ -112,38 +287,61 @@ def load_hymod_metric_simulation():
     return pd.DataFrame(arr, columns=col_names)
 
 
-def load_hymod_simulation():
-    """Load HYMOD simulated outputs.  For use in 'hymod.ipynb'"""
+def load_hymod_simulation(dtype=None):
+    """Load HYMOD simulated outputs.  For use in 'hymod.ipynb'
+
+    :param dtype:           Optional data type for the simulated flow columns (those starting with
+                            'Q'), e.g. numpy.float32 to halve memory; parsed directly into that type
+
+    """
 
     f = str(
         importlib.resources.files("msdbook").joinpath("data", "hymod_simulations_256samples.csv")
     )
 
-    return pd.read_csv(f)
+    if dtype is None:
+        return _read_csv(f)
+
+    # read the header only to find the simulation columns
+    columns = pd.read_csv(f, nrows=0).columns
+
+    return _read_csv(f, dtype={i: dtype for i in columns if i.startswith("Q")})
 
 
-def load_hymod_monthly_simulations():
-    """Load HYMOD monthly simulation.  For use in 'hymod.ipynb'"""
+def load_hymod_monthly_simulations(mmap_mode=None):
+    """Load HYMOD monthly simulation.  For use in 'hymod.ipynb'
+
+    :param mmap_mode:       Optional memory-map mode passed to `np.load`
+
+    """
 
     f_delta = str(importlib.resources.files("msdbook").joinpath("data", "sa_by_mth_delta.npy"))
     f_s1 = str(importlib.resources.files("msdbook").joinpath("data", "sa_by_mth_s1.npy"))
 
-    return np.load(f_delta), np.load(f_s1)
+    return np.load(f_delta, mmap_mode=mmap_mode), np.load(f_s1, mmap_mode=mmap_mode)
 
 
-def load_hymod_annual_simulations():
-    """Load HYMOD annual simulation.  For use in 'hymod.ipynb'"""
+def load_hymod_annual_simulations(mmap_mode=None):
+    """Load HYMOD annual simulation.  For use in 'hymod.ipynb'
+
+    :param mmap_mode:       Optional memory-map mode passed to `np.load`
+
+    """
 
     f_delta = str(importlib.resources.files("msdbook").joinpath("data", "sa_by_yr_delta.npy"))
     f_s1 = str(importlib.resources.files("msdbook").joinpath("data", "sa_by_yr_s1.npy"))
 
-    return np.load(f_delta), np.load(f_s1)
+    return np.load(f_delta, mmap_mode=mmap_mode), np.load(f_s1, mmap_mode=mmap_mode)
+
 
+def load_hymod_varying_simulations(mmap_mode=None):
+    """Load HYMOD time varying simulation.  For use in 'hymod.ipynb'
 
-def load_hymod_varying_simulations():
-    """Load HYMOD time varying simulation.  For use in 'hymod.ipynb'"""
+    :param mmap_mode:       Optional memory-map mode passed to `np.load`
+
+    """
 
     f_delta = str(importlib.resources.files("msdbook").joinpath("data", "sa_vary_delta.npy"))
     f_s1 = str(importlib.resources.files("msdbook").joinpath("data", "sa_vary_s1.npy"))
 
-    return np.load(f_delta), np.load(f_s1)
+    return np.load(f_delta, mmap_mode=mmap_mode), np.load(f_s1, mmap_mode=mmap_mode)
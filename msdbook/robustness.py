@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from msdbook.generalized_fish_game import fish_game_batch
+from msdbook.utils import atomic_savez
+
+
+# performance measures returned by `reevaluate_policies`, in the minimization form of
+# `fish_game` (NPV and the 1st percentile harvest are negated) followed by the constraint
+FISH_GAME_MEASURES = (
+    "NPV",
+    "prey_deficit",
+    "low_harvest_duration",
+    "worst_harvest",
+    "harvest_variance",
+    "collapse_days",
+)
+
+
+def _digest(values):
+    """Return a hex digest identifying an array of float64 values."""
+
+    return hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+
+class EvaluationCache:
+    """On-disk cache of fish game performance for each (policy, SOW) cell.
+
+    Every `store` writes a new `.npz` file in `directory` holding the digests of the SOWs a policy
+    was evaluated in and its performance there, and `lookup` merges all files of the policy.  Files
+    are never rewritten, so several processes can share one cache directory without losing each
+    other's cells, and re-evaluating with added policies or SOWs only simulates the new cells.  The
+    evaluation settings are part of every policy's key, so results from different settings never
+    mix.
+
+    :param directory:           Directory of the cache files; created if missing
+    :param settings:            Evaluation settings, e.g. N, tSteps, strategy and seed
+
+    """
+
+    def __init__(self, directory, **settings):
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = str(directory)
+        self.settings = json.dumps(settings, sort_keys=True)
+
+    def _key(self, policy):
+        """Return the key of a policy under the current settings."""
+
+        key = hashlib.sha1(self.settings.encode())
+        key.update(np.ascontiguousarray(policy, dtype=np.float64).tobytes())
+
+        return key.hexdigest()
+
+    def _files(self, policy):
+        """Return the cache files of a policy, leaving out files still being written."""
+
+        prefix = f"{self._key(policy)}."
+
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(prefix) and name.endswith(".npz") and not name.endswith(".tmp.npz")
+        )
+
+    def lookup(self, policy, sow_keys, n_measures=len(FISH_GAME_MEASURES)):
+        """Return the cached performance of a policy in the given SOWs.
+
+        :param policy:              Decision variables of the policy
+        :param sow_keys:            Digests of the SOWs
+        :param n_measures:          Number of performance measures per cell
+
+        :return:                    An array of shape (n_sow, n_measures), NaN where missing, and a
+                                    boolean array marking the SOWs found
+
+        """
+        values = np.full((len(sow_keys), n_measures), np.nan)
+        found = np.zeros(len(sow_keys), dtype=bool)
+        index = {key: i for i, key in enumerate(sow_keys)}
+
+        for path in self._files(policy):
+            with np.load(path) as data:
+                rows = [index.get(key, -1) for key in data["sows"]]
+                hits = np.array([i >= 0 for i in rows], dtype=bool)
+                if hits.any():
+                    targets = [i for i in rows if i >= 0]
+                    values[targets] = data["values"][hits]
+                    found[targets] = True
+
+        return values, found
+
+    def store(self, policy, sow_keys, values):
+        """Write the performance of a policy in some SOWs to a new cache file."""
+
+        sow_keys = np.asarray(sow_keys, dtype="U40")
+        values = np.asarray(values, dtype=np.float64)
+
+        batch = hashlib.sha1(sow_keys.tobytes()).hexdigest()
+        path = os.path.join(self.directory, f"{self._key(policy)}.{batch}.npz")
+
+        atomic_savez(path, sows=sow_keys, values=values)
+
+
+def reevaluate_policies(
+    policies,
+    sows,
+    strategy="Previous_Prey",
+    N=100,
+    tSteps=100,
+    seed=0,
+    cache=None,
+    processes=None,
+    chunk_size=100,
+):
+    """Evaluate every policy in every state of the world (SOW), reusing cached cells.
+
+    The stochasticity of each SOW is seeded from `seed` and the SOW's own parameter values and
+    shared by all policies (common random numbers), so a cell's result does not depend on which
+    other policies or SOWs are evaluated with it.
+
+    :param policies:            Decision variables of shape (n_policy, 6), e.g. the first six
+                                columns of `load_profit_maximization_data()`
+    :param sows:                Array of shape (n_sow, 9) with columns a, b, c, d, h, K, m, sigmaX,
+                                sigmaY, e.g. from `load_saltelli_param_values()`
+    :param strategy:            management strategy
+    :param N:                   Number of realizations of environmental stochasticity
+    :param tSteps:              no. of timesteps to run the fish game on
+    :param seed:                Integer seed of the stochasticity
+    :param cache:               Optional directory of an `EvaluationCache`
+    :param processes:           Number of worker processes passed to `fish_game_batch`
+    :param chunk_size:          Number of SOWs simulated together per task
+
+    :return:                    Performance array of shape (n_policy, n_sow, 6) ordered as
+                                `FISH_GAME_MEASURES`
+
+    """
+    policies = np.atleast_2d(np.asarray(policies, dtype=np.float64))
+    sows = np.atleast_2d(np.asarray(sows, dtype=np.float64))
+    n_measures = len(FISH_GAME_MEASURES)
+
+    sow_keys = [_digest(sow) for sow in sows]
+    streams = [np.random.SeedSequence(seed, spawn_key=(int(key[:15], 16),)) for key in sow_keys]
+
+    if cache is not None:
+        cache = EvaluationCache(cache, strategy=strategy, N=N, tSteps=tSteps, seed=seed)
+        cached = [cache.lookup(policy, sow_keys, n_measures) for policy in policies]
+    else:
+        cached = [
+            (np.full((len(sows), n_measures), np.nan), np.zeros(len(sows), dtype=bool))
+            for _ in policies
+        ]
+
+    performance = np.stack([values for values, _ in cached])
+
+    # policies missing the same SOWs are simulated together
+    groups = {}
+    for p, (_, found) in enumerate(cached):
+        if not found.all():
+            groups.setdefault(found.tobytes(), []).append(p)
+
+    for members in groups.values():
+        missing = np.flatnonzero(~cached[members[0]][1])
+
+        objs, cnstr = fish_game_batch(
+            policies[members],
+            sows[missing],
+            strategy=strategy,
+            N=N,
+            tSteps=tSteps,
+            processes=processes,
+            chunk_size=chunk_size,
+            seed=[streams[i] for i in missing],
+        )
+        values = np.concatenate([objs, cnstr], axis=2)
+
+        for i, p in enumerate(members):
+            performance[p, missing] = values[i]
+            if cache is not None:
+                cache.store(policies[p], [sow_keys[j] for j in missing], values[i])
+
+    return performance
+
+
+def _measure_index(name):
+    """Return the column of a performance measure given by name or index."""
+
+    return FISH_GAME_MEASURES.index(name) if isinstance(name, str) else int(name)
+
+
+def satisficing(performance, criteria):
+    """Fraction of SOWs in which each policy meets every satisficing criterion.
+
+    :param performance:         Performance array of shape (n_policy, n_sow, n_measures) from
+                                `reevaluate_policies`
+    :param criteria:            Dictionary mapping measure names from `FISH_GAME_MEASURES` (or
+                                column indices) to the largest acceptable value in minimization
+                                form, e.g. ``{"collapse_days": 0, "NPV": -1500}``
+
+    :return:                    Array of shape (n_policy,)
+
+    """
+    performance = np.asarray(performance)
+    satisfied = np.ones(performance.shape[:2], dtype=bool)
+
+    for name, threshold in criteria.items():
+        satisfied &= performance[:, :, _measure_index(name)] <= threshold
+
+    return satisfied.mean(axis=1)
+
+
+def regret(performance, baseline=None, percentile=90):
+    """Regret of each policy for each measure at a percentile of the SOWs (Herman et al., 2015).
+
+    Without a `baseline` the regret in a SOW is how much worse a policy does than the best
+    policy in that SOW; with one it is how much worse it does than in the baseline SOW.
+
+    :param performance:         Performance array of shape (n_policy, n_sow, n_measures) from
+                                `reevaluate_policies`
+    :param baseline:            Optional performance of the policies in the baseline SOW, shape
+                                (n_policy, n_measures)
+    :param percentile:          Percentile of the regrets across SOWs to report
+
+    :return:                    Array of shape (n_policy, n_measures)
+
+    """
+    performance = np.asarray(performance)
+
+    if baseline is None:
+        reference = np.nanmin(performance, axis=0, keepdims=True)
+    else:
+        reference = np.asarray(baseline)[:, None, :]
+
+    return np.nanpercentile(np.maximum(performance - reference, 0), percentile, axis=1)
+
+
+def robustness_analysis(policies, sows, criteria, baseline_sow=None, percentile=90, **kwargs):
+    """Re-evaluate policies across SOWs and compute their satisficing and regret robustness.
+
+    :param policies:            Decision variables of shape (n_policy, 6)
+    :param sows:                Array of shape (n_sow, 9) of SOW parameters
+    :param criteria:            Satisficing criteria as in `satisficing`
+    :param baseline_sow:        Optional baseline SOW of 9 parameters for regret from the baseline;
+                                regret is measured against the best policy otherwise
+    :param percentile:          Percentile of the regrets across SOWs to report
+    :param kwargs:              Additional keyword arguments passed to `reevaluate_policies`,
+                                e.g. `cache` and `processes`
+
+    :return:                    A dictionary of the `performance` array, the `satisficing`
+                                fraction of each policy and the `regret` of each policy and
+                                measure
+
+    """
+    performance = reevaluate_policies(policies, sows, **kwargs)
+
+    baseline = None
+    if baseline_sow is not None:
+        baseline = reevaluate_policies(policies, np.atleast_2d(baseline_sow), **kwargs)[:, 0]
+
+    return {
+        "performance": performance,
+        "satisficing": satisficing(performance, criteria),
+        "regret": regret(performance, baseline, percentile),
+    }
@@ -0,0 +1,68 @@
+import itertools
+
+import pytest
+import numpy as np
+
+from msdbook.fishery_objectives import (
+    longest_run,
+    low_harvest_streak,
+    discounted_npv,
+    harvest_percentile,
+    harvest_variance,
+    prey_deficit,
+    collapse_days,
+    fishery_objectives,
+)
+
+
+@pytest.fixture
+def trajectories():
+    """Fixture for prey, predator and harvest trajectories of shape (2 SOWs, 3 realizations, 11)."""
+    rng = np.random.default_rng(0)
+    prey = rng.uniform(0, 100, (2, 3, 11))
+    predator = rng.uniform(0, 5, (2, 3, 11))
+    harvest = prey * rng.uniform(0, 0.1, (2, 3, 11))
+    return prey, predator, harvest
+
+
+def test_longest_run():
+    mask = np.array([
+        [True, True, False, True, True, True, False],
+        [False, False, False, False, False, False, False],
+        [True, True, True, True, True, True, True],
+    ])
+    np.testing.assert_array_equal(longest_run(mask), [3, 0, 7])
+
+def test_low_harvest_streak_threshold():
+    """Test the threshold is prey / 20, which rounds differently from prey * 0.05 here."""
+    prey = np.array([4.0973523936194685])
+    harvest = np.array([0.20486761968097342])
+    assert harvest[0] >= prey[0] / 20 and harvest[0] < prey[0] * 0.05
+    np.testing.assert_array_equal(low_harvest_streak(harvest, prey), 0)
+
+def test_row_statistics(trajectories):
+    """Test each statistic matches a per-realization loop over the trajectories."""
+    prey, predator, harvest = trajectories
+    streaks = low_harvest_streak(harvest, prey)
+    npv = discounted_npv(harvest)
+    for s, i in itertools.product(range(2), range(3)):
+        low_hrv = harvest[s, i] < prey[s, i] / 20
+        count = [sum(1 for _ in group) for key, group in itertools.groupby(low_hrv) if key]
+        assert streaks[s, i] == max(count, default=0)
+        expected = sum(harvest[s, i, t] * 1.05 ** (-t) for t in range(11))
+        np.testing.assert_allclose(npv[s, i], expected, rtol=1e-12)
+    np.testing.assert_allclose(harvest_percentile(harvest), np.percentile(harvest, 1, axis=2))
+    np.testing.assert_allclose(harvest_variance(harvest), harvest.var(axis=2))
+    np.testing.assert_array_equal(collapse_days(predator), (predator < 1).sum(axis=2))
+
+def test_fishery_objectives(trajectories):
+    """Test the objectives average the per-realization statistics over realizations."""
+    prey, predator, harvest = trajectories
+    K = np.array([100.0, 120.0])
+    objs, cnstr = fishery_objectives(prey, predator, harvest, K)
+    assert objs.shape == (2, 5)
+    assert cnstr.shape == (2,)
+    np.testing.assert_allclose(objs[:, 0], -discounted_npv(harvest).mean(axis=1))
+    np.testing.assert_allclose(objs[1, 1], np.mean((120.0 - prey[1]) / 120.0))
+    np.testing.assert_allclose(prey_deficit(prey[0], 100.0), np.mean((100 - prey[0]) / 100, axis=1))
+    np.testing.assert_allclose(cnstr, (predator < 1).sum(axis=2).mean(axis=1))
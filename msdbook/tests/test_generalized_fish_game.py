@@ -7,7 +7,9 @@ from msdbook.generalized_fish_game import (
     plot_uncertainty_relationship,
     plot_solutions,
     fish_game,
-    hrvSTR
+    fish_game_batch,
+    hrvSTR,
+    RBFPolicy,
 )
 
 # Register the mpl_image_compare marker to prevent unknown marker warnings
@@ -33,6 +35,26 @@ def test_hrvSTR():
     expected = [0.92786921]  # Adjust this if needed
     assert np.allclose(result, expected, atol=0.05), f"Expected {expected}, but got {result}"
 
+def test_rbf_policy():
+    rng = np.random.default_rng(0)
+    vars = rng.random(20) + [0, 0.5, 0, 0.5, 0, 0.5, 0, 0, 0, 0] * 2
+    input_ranges = [[0, 10], [0, 5], [0, 1]]
+    output_ranges = [[0, 1], [0, 2], [0.5, 1], [0, 3]]
+    policy = RBFPolicy(vars, input_ranges, output_ranges, nRBF=2, nIn=3, nOut=4)
+    Inputs = rng.random((6, 3)) * [10, 5, 1]
+
+    result = policy(Inputs)
+    assert result.shape == (6, 4)
+    expected = [
+        [0.22061584905541623, 0.603519102686163, 0.6686535073980525, 1.0784624391262227],
+        [0.4378820809532721, 0.7806397779305261, 0.6847419130533676, 1.0694483948713587],
+    ]  # from the original per-sample loop
+    np.testing.assert_allclose(result[:2], expected, rtol=1e-12)
+    np.testing.assert_allclose(policy(Inputs[0]), result[0])
+    np.testing.assert_allclose(
+        hrvSTR(Inputs[1], vars, input_ranges, output_ranges, nRBF=2, nIn=3, nOut=4), result[1]
+    )
+
 def test_fish_game():
     vars = [0.1] * 20
     additional_inputs = [
@@ -51,6 +73,95 @@ def test_fish_game():
     assert np.all(np.isfinite(objs))
     assert np.all(np.isfinite(cnstr))
 
+def test_fish_game_matches_loop():
+    """Test the vectorized realizations reproduce the per-realization loop for a fixed seed."""
+    additional_inputs = [
+        "Previous_Prey",
+        "0.1", "0.2", "0.3", "0.4", "0.5", "0.6", "0.7", "0.8", "0.9"
+    ]
+    np.random.seed(0)
+    objs, cnstr = fish_game([0.1] * 20, additional_inputs, 10, 100)
+    expected = [-0.02153224004015978, 0.47379134826120717, 22.9, 0.0035562200119936523,
+                0.00013267159734283273]
+    np.testing.assert_allclose(objs, expected, rtol=1e-12)
+    np.testing.assert_allclose(cnstr, [66.3], rtol=1e-12)
+
+    np.random.seed(1)
+    vars = list(np.random.rand(6))
+    objs, cnstr = fish_game(
+        vars, ["Previous_Prey", 0.005, 0.5, 0.5, 0.1, 0.1, 2000, 0.7, 0.004, 0.004], 100, 100
+    )
+    expected = [-28.123449386751997, 0.05095306143934933, 101.0, -1.2852049788269202,
+                0.0002128186659285106]
+    np.testing.assert_allclose(objs, expected, rtol=1e-12)
+    np.testing.assert_allclose(cnstr, [0.0])
+
+    # every realization collapses within a few steps
+    np.random.seed(7)
+    objs, cnstr = fish_game(
+        [0.5, 0.8, 1.0, 0.9, 0.5, 1.0],
+        ["Previous_Prey", 2.0, 0.01, 0.3, 0.5, 0.01, 500, 0.2, 0.3, 0.3], 20, 60
+    )
+    expected = [14484.193178313919, 1.609869467709272, 1.0, 6255.290579849822,
+                4190271.2320944853]
+    np.testing.assert_allclose(objs, expected, rtol=1e-12)
+    np.testing.assert_allclose(cnstr, [59.0])
+
+def test_fish_game_batch():
+    """Test batched SOWs and policies match one fish_game call per pair for a fixed seed."""
+    rng = np.random.default_rng(2)
+    policies = rng.random((2, 6))
+    sows = np.column_stack([
+        rng.uniform(0.002, 2, 5), rng.uniform(0.005, 1, 5), rng.uniform(0.2, 1, 5),
+        rng.uniform(0.05, 0.5, 5), rng.uniform(0.001, 1, 5), rng.uniform(100, 2000, 5),
+        rng.uniform(0.1, 1.5, 5), rng.uniform(0.001, 0.5, 5), rng.uniform(0.001, 0.5, 5),
+    ])
+
+    np.random.seed(3)
+    expected = [
+        [fish_game(list(p), ["Previous_Prey"] + list(s), N=10, tSteps=30) for s in sows]
+        for p in policies
+    ]
+    for processes in [1, 2]:
+        np.random.seed(3)
+        objs, cnstr = fish_game_batch(
+            policies, sows, N=10, tSteps=30, processes=processes, chunk_size=2
+        )
+        assert objs.shape == (2, 5, 5)
+        assert cnstr.shape == (2, 5, 1)
+        np.testing.assert_allclose(objs, [[e[0] for e in row] for row in expected], rtol=1e-12)
+        np.testing.assert_allclose(cnstr, [[e[1] for e in row] for row in expected])
+
+    with pytest.raises(ValueError):
+        fish_game_batch(policies, sows[:, :8])
+
+def test_fish_game_random_streams():
+    """Test seeded streams are reproducible across processes and shared in common noise mode."""
+    rng = np.random.default_rng(4)
+    policies = rng.random((2, 6))
+    sows = np.tile([0.005, 0.5, 0.5, 0.1, 0.1, 2000, 0.7, 0.004, 0.004], (3, 1))
+    sows[:, 7:] = [[0.1, 0.1], [0.2, 0.05], [0.05, 0.2]]
+
+    serial = fish_game_batch(policies, sows, N=8, tSteps=20, processes=1, seed=11)
+    pooled = fish_game_batch(policies, sows, N=8, tSteps=20, processes=2, chunk_size=1, seed=11)
+    np.testing.assert_array_equal(serial[0], pooled[0])
+    children = np.random.SeedSequence(11).spawn(6)
+    objs, cnstr = fish_game(
+        list(policies[1]), ["Previous_Prey"] + list(sows[2]), N=8, tSteps=20, rng=children[5]
+    )
+    np.testing.assert_allclose(serial[0][1, 2], objs, rtol=1e-12)
+
+    same = fish_game_batch(policies[[0, 0]], sows, N=8, tSteps=20, processes=1, seed=11,
+                           common_noise=True)
+    np.testing.assert_array_equal(same[0][0], same[0][1])
+    noise = np.random.default_rng(np.random.SeedSequence(11).spawn(3)[1]).standard_normal((2, 8))
+    objs, cnstr = fish_game(
+        list(policies[0]), ["Previous_Prey"] + list(sows[1]), N=8, tSteps=20, noise=noise
+    )
+    np.testing.assert_allclose(same[0][0, 1], objs, rtol=1e-12)
+    with pytest.raises(ValueError):
+        fish_game(list(policies[0]), ["Previous_Prey"] + list(sows[1]), N=8, noise=noise[0])
+
 @pytest.mark.mpl_image_compare
 def test_plot_uncertainty_relationship():
     param_values = np.random.rand(10, 7)
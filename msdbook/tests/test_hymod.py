@@ -13,8 +13,25 @@ from msdbook.hymod import (
     Pdm01,
     Nash,
     Hymod01,
-    hymod
+    hymod,
+    hymod_ensemble,
+    simulate_hymod_sample,
+    hymod_sobol,
+    HymodForcing,
+    HymodWarmupCache,
+    get_hymod_state,
+    iter_hymod,
+    iter_hymod_ensemble,
+    accumulate_hymod_chunks,
+    glue,
+    time_varying_sensitivity,
+    nash_cascade,
+    linear_reservoir,
+    PdmParameters,
+    pdm_step,
+    HymodSimulationStore,
 )
+from SALib.sample import sobol as sobol_sample
 
 @pytest.fixture
 def sample_data():
@@ -89,3 +106,266 @@ def test_hymod(sample_data):
     assert isinstance(results, dict)
     assert all(key in results for key in ["XHuz", "XCuz", "Xq", "Xs", "ET", "OV", "Qq", "Qs", "Q"])
     assert isinstance(results["Q"], np.ndarray)
+
+def test_hymod_ensemble(sample_data):
+    """Test hymod_ensemble matches the scalar path for every parameter set."""
+    params = np.array([
+        [0.5, 0.1, 0.3, 0.5, 1.0],
+        [0.2, 0.05, 0.7, 50.0, 0.4],
+        [0.9, 0.0, 0.1, 200.0, 1.8],
+    ])
+    results = hymod_ensemble(params, sample_data, Nq=2)
+    assert results["Q"].shape == (10, 3)
+    assert results["Xq"].shape == (10, 3, 2)
+    for j, (Kq, Ks, Alp, Huz, B) in enumerate(params):
+        expected = hymod(2, Kq, Ks, Alp, Huz, B, sample_data, 10)
+        for key in ["XHuz", "XCuz", "Xs", "ET", "OV", "Qq", "Qs", "Q"]:
+            np.testing.assert_allclose(results[key][:, j], expected[key], rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(results["Xq"][:, j, :], expected["Xq"], rtol=1e-10, atol=1e-12)
+
+def test_hymod_ensemble_bad_params(sample_data):
+    """Test hymod_ensemble rejects parameter arrays with the wrong number of columns."""
+    with pytest.raises(ValueError):
+        hymod_ensemble(np.ones((2, 4)), sample_data)
+
+def test_simulate_hymod_sample(sample_data):
+    """Test simulate_hymod_sample matches hymod_ensemble with and without a process pool."""
+    params = np.random.rand(7, 5) * [0.9, 0.1, 1.0, 100.0, 1.9] + [0.1, 0.0, 0.0, 0.1, 0.0]
+    expected = hymod_ensemble(params, sample_data)["Q"]
+    serial = simulate_hymod_sample(params, sample_data, processes=1, chunk_size=3)
+    pooled = simulate_hymod_sample(params, sample_data, processes=2, chunk_size=3)
+    np.testing.assert_allclose(serial, expected)
+    np.testing.assert_allclose(pooled, expected)
+
+def test_hymod_sobol(sample_data):
+    """Test hymod_sobol returns first and total order indices for each parameter."""
+    problem = {
+        "num_vars": 5,
+        "names": ["Kq", "Ks", "Alp", "Huz", "B"],
+        "bounds": [[0.1, 1], [0, 0.1], [0, 1], [0.1, 500], [0, 1.9]],
+    }
+    param_values = sobol_sample.sample(problem, 8)
+    Si = hymod_sobol(problem, param_values, sample_data, processes=1, calc_second_order=True)
+    assert Si["S1"].shape == (5,)
+    assert Si["ST"].shape == (5,)
+
+def test_hymod_outputs(sample_data):
+    """Test hymod keeps only the selected outputs and matches the full run."""
+    full = hymod(3, 0.5, 0.1, 0.3, 50.0, 1.0, sample_data, 10)
+    results = hymod(3, 0.5, 0.1, 0.3, 50.0, 1.0, sample_data, 10, outputs=["Q", "Xq"])
+    assert list(results) == ["Q", "Xq"]
+    np.testing.assert_array_equal(results["Q"], full["Q"])
+    np.testing.assert_array_equal(results["Xq"], full["Xq"])
+    ensemble = hymod_ensemble([[0.5, 0.1, 0.3, 50.0, 1.0]], sample_data, outputs="Q")
+    assert list(ensemble) == ["Q"]
+    np.testing.assert_allclose(ensemble["Q"][:, 0], full["Q"])
+    with pytest.raises(ValueError):
+        hymod(3, 0.5, 0.1, 0.3, 50.0, 1.0, sample_data, 10, outputs=["Flow"])
+
+def test_hymod_forcing(sample_data):
+    """Test HymodForcing holds contiguous arrays and gives the same results as the dataframe."""
+    forcing = HymodForcing.from_dataframe(sample_data)
+    assert forcing.precip.dtype == np.float64 and forcing.precip.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(forcing.strmflw, sample_data["Strmflw"].to_numpy())
+    assert len(forcing[:4]) == 4
+    expected = hymod(3, 0.5, 0.1, 0.3, 50.0, 1.0, sample_data, 8)
+    results = hymod(3, 0.5, 0.1, 0.3, 50.0, 1.0, forcing, 8)
+    for key in expected:
+        np.testing.assert_array_equal(results[key], expected[key])
+    np.testing.assert_array_equal(
+        hymod_ensemble([[0.5, 0.1, 0.3, 50.0, 1.0]], forcing)["Q"],
+        hymod_ensemble([[0.5, 0.1, 0.3, 50.0, 1.0]], sample_data)["Q"],
+    )
+
+def test_hymod_restart_from_state(sample_data):
+    """Test a run restarted from a saved state continues the uninterrupted run."""
+    full = hymod(3, 0.5, 0.1, 0.3, 5.0, 1.0, sample_data, 10)
+    init = get_hymod_state(full, day=3)
+    tail = hymod(3, 0.5, 0.1, 0.3, 5.0, 1.0, sample_data, 6, init=init, start=4)
+    for key in full:
+        np.testing.assert_array_equal(tail[key], full[key][4:])
+    params = [[0.5, 0.1, 0.3, 5.0, 1.0], [0.2, 0.05, 0.6, 2.0, 0.4]]
+    ensemble = hymod_ensemble(params, sample_data)
+    _, state = hymod_ensemble(params, sample_data, ndays=4, outputs=(), return_state=True)
+    tail = hymod_ensemble(params, sample_data, init=state, start=4)
+    np.testing.assert_allclose(tail["Q"], ensemble["Q"][4:])
+
+def test_hymod_warmup_cache(sample_data):
+    """Test HymodWarmupCache reuses warm-up states and matches the full run."""
+    cache = HymodWarmupCache(sample_data, warmup_days=4, maxsize=1)
+    full = hymod(3, 0.5, 0.1, 0.3, 5.0, 1.0, sample_data, 10)
+    results = cache.run(3, 0.5, 0.1, 0.3, 5.0, 1.0, start=6)
+    np.testing.assert_array_equal(results["Q"], full["Q"][6:])
+    cache.run(3, 0.5, 0.1, 0.3, 5.0, 1.0, ndays=2)
+    cache.run(3, 0.2, 0.1, 0.3, 5.0, 1.0)
+    assert len(cache) == 1
+    with pytest.raises(ValueError):
+        cache.run(3, 0.5, 0.1, 0.3, 5.0, 1.0, start=2)
+
+def test_iter_hymod(sample_data):
+    """Test chunked HYMOD runs reproduce the monolithic run."""
+    full = hymod(3, 0.5, 0.1, 0.3, 5.0, 1.0, sample_data, 10)
+    chunks = list(iter_hymod(3, 0.5, 0.1, 0.3, 5.0, 1.0, sample_data, chunk_days=3))
+    assert [len(i["Q"]) for i in chunks] == [3, 3, 3, 1]
+    for key in full:
+        np.testing.assert_array_equal(np.concatenate([i[key] for i in chunks]), full[key])
+    pieces = [sample_data.iloc[:6], sample_data.iloc[6:]]
+    totals = accumulate_hymod_chunks(iter_hymod(3, 0.5, 0.1, 0.3, 5.0, 1.0, pieces))
+    assert totals["count"] == 10
+    np.testing.assert_allclose(totals["mean"], full["Q"].mean())
+    np.testing.assert_allclose(totals["max"], full["Q"].max())
+
+def test_iter_hymod_ensemble(sample_data):
+    """Test chunked ensemble runs reproduce the monolithic ensemble run."""
+    params = [[0.5, 0.1, 0.3, 5.0, 1.0], [0.2, 0.05, 0.6, 2.0, 0.4]]
+    full = hymod_ensemble(params, sample_data)
+    chunks = iter_hymod_ensemble(params, sample_data, chunk_days=4, outputs=["Q"])
+    totals = accumulate_hymod_chunks(chunks)
+    np.testing.assert_allclose(totals["sum"], full["Q"].sum(axis=0))
+    np.testing.assert_allclose(totals["min"], full["Q"].min(axis=0))
+
+def test_glue(sample_data):
+    """Test glue keeps only behavioral runs and matches scoring the full ensemble."""
+    from msdbook.metrics import nse
+
+    problem = {
+        "num_vars": 5,
+        "names": ["Kq", "Ks", "Alp", "Huz", "B"],
+        "bounds": [[0.1, 1], [0, 0.1], [0, 1], [0.1, 5], [0, 1.9]],
+    }
+    results = glue(sample_data, problem, 50, likelihood="nse", top_k=5, batch_size=8, seed=1)
+    assert results["params"].shape == (5, 5)
+    assert results["Q"].shape == (10, 5)
+    assert results["n_evaluated"] == 50
+    assert np.all(np.diff(results["scores"]) <= 0)
+
+    bounds = np.array(problem["bounds"])
+    params = bounds[:, 0] + np.random.default_rng(1).random((50, 5)) * np.ptp(bounds, axis=1)
+    scores = nse(hymod_ensemble(params, sample_data)["Q"], sample_data["Strmflw"])
+    np.testing.assert_allclose(results["scores"], np.sort(scores)[::-1][:5])
+
+    threshold = np.median(scores)
+    filtered = glue(sample_data, param_values=params, likelihood="nse", threshold=threshold,
+                    problem=problem, batch_size=8, keep_flows=False)
+    assert len(filtered["scores"]) == np.sum(scores >= threshold)
+    assert "Q" not in filtered
+
+    mse_runs = glue(sample_data, problem, 20, likelihood="mse", top_k=3, seed=2)
+    assert np.all(np.diff(mse_runs["scores"]) >= 0)
+    with pytest.raises(ValueError):
+        glue(sample_data, problem, 20)
+
+def test_time_varying_sensitivity():
+    """Test windowed Sobol indices match SALib and delta indices are produced per window."""
+    from SALib.analyze import sobol
+
+    problem = {"num_vars": 3, "names": ["a", "b", "c"], "bounds": [[0, 1]] * 3}
+    X = sobol_sample.sample(problem, 16)
+    dates = pd.date_range("2000-01-01", "2001-12-31")
+    rng = np.random.default_rng(0)
+    scale = 1 + rng.random(len(dates))
+    sim = scale[:, None] * (X[:, 0] + 2 * X[:, 1] ** 2)[None, :]
+
+    results = time_varying_sensitivity(problem, X, sim, dates, window="year", methods=("sobol",))
+    np.testing.assert_array_equal(results["labels"], [2000, 2001])
+    Y = sim[dates.year == 2001].mean(axis=0)
+    expected = sobol.analyze(problem, Y)
+    np.testing.assert_allclose(results["S1"][1], expected["S1"])
+    np.testing.assert_allclose(results["ST"][1], expected["ST"])
+    assert results["S1_conf"].shape == (2, 3)
+
+    rolling = time_varying_sensitivity(
+        problem, X, sim, dates, window=3, methods=("delta",), num_resamples=5, processes=1
+    )
+    assert len(rolling["labels"]) == 22
+    assert rolling["delta"].shape == (22, 3)
+    assert rolling["delta_S1"].shape == (22, 3)
+    with pytest.raises(ValueError):
+        time_varying_sensitivity(problem, X, sim, dates, window="week")
+
+def test_sobol_windows_blocks(monkeypatch):
+    """Test bootstrapping a few windows at a time gives the same indices as one block."""
+    from msdbook import hymod
+
+    Y = np.random.default_rng(1).normal(size=(7, 32 * 8))
+    full = hymod._sobol_windows(Y, 3, True, 50, 0.95, 2)
+    monkeypatch.setattr(hymod, "_SOBOL_BOOTSTRAP_SIZE", 32 * 50 * 2)
+    blocked = hymod._sobol_windows(Y, 3, True, 50, 0.95, 2)
+    for key in full:
+        np.testing.assert_allclose(blocked[key], full[key], rtol=1e-12)
+
+def test_nash_cascade():
+    """Test the in-place cascade kernel matches Nash for single and ensemble states."""
+    Xbeg = np.array([1.0, 2.0, 3.0])
+    expected_out, expected_X = Nash(0.3, 3, Xbeg, 0.5)
+    X = Xbeg.copy()
+    out = nash_cascade(0.3, X, 0.5)
+    assert out == expected_out
+    np.testing.assert_array_equal(X, expected_X)
+
+    X = np.array([[1.0, 2.0, 3.0], [0.5, 0.0, 4.0]])
+    K = np.array([0.3, 0.7])
+    out = nash_cascade(K, X, np.array([0.5, 1.0]), work=np.zeros((2, 2)))
+    for j, (k, inp) in enumerate([(0.3, 0.5), (0.7, 1.0)]):
+        expected_out, expected_X = Nash(k, 3, np.array([[1.0, 2.0, 3.0], [0.5, 0.0, 4.0]])[j], inp)
+        assert out[j] == expected_out
+        np.testing.assert_array_equal(X[j], expected_X)
+
+def test_linear_reservoir():
+    """Test the single tank kernel matches the scalar-state branch of Nash."""
+    expected_out, expected_X = Nash(0.2, 1, 4.0, 1.0)
+    out, X = linear_reservoir(0.2, 4.0)
+    assert out == expected_out and X == expected_X[0]
+    X = np.array([4.0, 2.0])
+    out, X = linear_reservoir(np.array([0.2, 0.5]), X, out=np.zeros(2))
+    np.testing.assert_array_equal(out, [0.8, 1.0])
+    np.testing.assert_array_equal(X, [3.2, 1.0])
+
+def test_pdm_parameters():
+    """Test cached soil moisture constants reproduce Pdm01 for scalars and ensembles."""
+    pars = PdmParameters(100.0, 1.0)
+    assert not hasattr(pars, "__dict__")
+    assert pdm_step(pars, 20.0, 5.0, 1.0) == Pdm01(100.0, 1.0, 20.0, 5.0, 1.0)
+    ensemble = PdmParameters(np.array([100.0, 50.0]), np.array([1.0, 0.5]))
+    np.testing.assert_allclose(ensemble.Cpar, [pars.Cpar, PdmParameters(50.0, 0.5).Cpar])
+
+def test_hymod_float32(sample_data):
+    """Test float32 outputs round the float64 results once and float32 states stay close."""
+    params = np.array([[0.5, 0.1, 0.3, 0.5, 1.0], [0.2, 0.05, 0.7, 50.0, 0.4]])
+    reference = hymod_ensemble(params, sample_data)
+    stored = hymod_ensemble(params, sample_data, dtype=np.float32)
+    assert stored["Q"].dtype == np.float32
+    np.testing.assert_array_equal(stored["Q"], reference["Q"].astype(np.float32))
+    single = hymod_ensemble(params, sample_data, dtype=np.float32, state_dtype=np.float32)
+    np.testing.assert_allclose(single["Q"], reference["Q"], atol=1e-4 * reference["Q"].max())
+    results = hymod(2, 0.5, 0.1, 0.3, 0.5, 1.0, sample_data, 10, dtype=np.float32)
+    assert results["Q"].dtype == np.float32
+    sample = simulate_hymod_sample(params, sample_data, processes=1, dtype=np.float32)
+    assert sample.dtype == np.float32
+    np.testing.assert_array_equal(sample, stored["Q"])
+
+def test_hymod_simulation_store(sample_data, tmp_path):
+    """Test a store filled by the sample driver or by time chunks reopens memory-mapped."""
+    problem = {"num_vars": 5, "names": ["Kq", "Ks", "Alp", "Huz", "B"],
+               "bounds": np.array([[0.1, 1], [0, 0.1], [0, 1], [0.1, 100], [0, 1.9]])}
+    params = np.random.rand(6, 5) * [0.9, 0.1, 1.0, 100.0, 1.9] + [0.1, 0.0, 0.0, 0.1, 0.0]
+    dates = pd.date_range("2000-01-01", periods=10)
+    expected = hymod_ensemble(params, sample_data)["Q"]
+
+    store = HymodSimulationStore.create(tmp_path / "sims", params, 10, problem=problem, dates=dates)
+    store.simulate(sample_data, processes=1, chunk_size=4)
+    loaded = HymodSimulationStore.open(tmp_path / "sims.npy")
+    assert isinstance(loaded.flows, np.memmap)
+    np.testing.assert_allclose(loaded.flows, expected)
+    np.testing.assert_array_equal(loaded.params, params)
+    assert loaded.problem["names"] == problem["names"]
+    pd.testing.assert_index_equal(loaded.dates, dates)
+    np.testing.assert_allclose(loaded.window("2000-01-03", "2000-01-05"), expected[2:5])
+
+    store = HymodSimulationStore.create(tmp_path / "chunks", params, 10, dtype=np.float32)
+    assert store.write_chunks(iter_hymod_ensemble(params, sample_data, chunk_days=3)) == 10
+    loaded = HymodSimulationStore.open(tmp_path / "chunks")
+    assert loaded.flows.dtype == np.float32
+    np.testing.assert_array_equal(loaded.flows, expected.astype(np.float32))
+    with pytest.raises(ValueError):
+        loaded.window("2000-01-01", "2000-01-02")
@@ -0,0 +1,148 @@
+import pytest
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from msdbook.mcmc import (
+    HymodLogPosterior,
+    metropolis,
+    gelman_rubin,
+    effective_sample_size,
+    predictive_quantiles,
+    prior_predictive_quantiles,
+    _LogHistogramQuantiles,
+)
+
+
+@pytest.fixture
+def sample_data():
+    """Fixture for sample input data."""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'Precip': rng.random(20) * 10,
+        'Pot_ET': rng.random(20),
+        'Strmflw': rng.random(20) + 0.1
+    })
+
+@pytest.fixture
+def priors():
+    """Fixture for the HYMOD priors used in 'mcmc.ipynb'."""
+    return [
+        stats.lognorm(s=0.25, scale=0.5),
+        stats.lognorm(s=0.95, scale=0.003),
+        stats.beta(2, 2),
+        stats.norm(100, 20),
+        stats.lognorm(s=0.1, scale=1),
+        stats.lognorm(s=0.05, scale=0.25),
+        stats.lognorm(s=0.25, scale=0.25),
+    ]
+
+def gaussian_log_posterior(params):
+    return -0.5 * np.sum(params**2, axis=1)
+
+def test_metropolis_gaussian():
+    """Test the sampler recovers a standard normal target and reports diagnostics."""
+    p0 = np.random.default_rng(1).normal(size=(4, 2))
+    out = metropolis(gaussian_log_posterior, p0, 4000, proposal_sd=[1.0, 1.0], thin=2,
+                     adapt_start=500, seed=42)
+    assert out["samples"].shape == (2000, 4, 2)
+    assert out["log_posterior"].shape == (2000, 4)
+    assert np.all((out["accept_rate"] > 0.1) & (out["accept_rate"] < 0.9))
+    draws = out["samples"][500:]
+    assert np.allclose(draws.reshape(-1, 2).mean(axis=0), 0, atol=0.2)
+    assert np.allclose(draws.reshape(-1, 2).std(axis=0), 1, atol=0.2)
+    assert np.all(gelman_rubin(draws) < 1.05)
+    ess = effective_sample_size(draws)
+    assert np.all((ess > 100) & (ess <= draws.shape[0] * draws.shape[1] * 2))
+
+def test_metropolis_checkpoint_resume(tmp_path):
+    """Test a run resumed from a checkpoint matches an uninterrupted run."""
+    p0 = np.zeros((3, 2))
+    kwargs = dict(proposal_sd=[0.5, 0.5], adapt_start=50, adapt_interval=25, seed=7)
+    full = metropolis(gaussian_log_posterior, p0, 200, **kwargs)
+    path = str(tmp_path / "chains.npz")
+    metropolis(gaussian_log_posterior, p0, 120, checkpoint=path, checkpoint_interval=40, **kwargs)
+    resumed = metropolis(gaussian_log_posterior, p0, 200, checkpoint=path, **kwargs)
+    np.testing.assert_array_equal(resumed["samples"], full["samples"])
+    np.testing.assert_array_equal(resumed["accept_rate"], full["accept_rate"])
+
+def test_metropolis_checkpoint_finished(tmp_path):
+    """Test a finished checkpoint is returned unchanged and a longer one is rejected."""
+    p0 = np.zeros((3, 2))
+    kwargs = dict(proposal_sd=[0.5, 0.5], seed=7)
+    path = str(tmp_path / "chains.npz")
+    full = metropolis(gaussian_log_posterior, p0, 60, checkpoint=path, **kwargs)
+    with open(path, "rb") as f:
+        saved = f.read()
+    again = metropolis(gaussian_log_posterior, p0, 60, checkpoint=path, **kwargs)
+    np.testing.assert_array_equal(again["samples"], full["samples"])
+    np.testing.assert_array_equal(again["accept_rate"], full["accept_rate"])
+    with pytest.raises(ValueError):
+        metropolis(gaussian_log_posterior, p0, 40, checkpoint=path, **kwargs)
+    with open(path, "rb") as f:
+        assert f.read() == saved
+
+def test_metropolis_requires_proposal():
+    """Test the sampler rejects a run without a proposal distribution."""
+    with pytest.raises(ValueError):
+        metropolis(gaussian_log_posterior, np.zeros((2, 2)), 10)
+
+def test_gelman_rubin_detects_separated_chains():
+    """Test R-hat is large for chains sampling different regions."""
+    rng = np.random.default_rng(3)
+    samples = rng.normal(size=(500, 2, 1)) + np.array([0.0, 5.0])[None, :, None]
+    assert gelman_rubin(samples)[0] > 1.5
+
+def test_hymod_log_posterior(sample_data, priors):
+    """Test the batched HYMOD posterior matches a direct calculation and rejects invalid vectors."""
+    from msdbook.hymod import hymod
+
+    log_posterior = HymodLogPosterior(sample_data, priors)
+    params = np.array([
+        [0.5, 0.003, 0.5, 100.0, 1.0, 0.25, 0.25],
+        [0.5, 0.003, 1.5, 100.0, 1.0, 0.25, 0.25],
+    ])
+    lp = log_posterior(params)
+    Q = hymod(3, *params[0, :5], sample_data, 20)["Q"]
+    residuals = np.log(sample_data["Strmflw"]) - np.log(Q + params[0, 5])
+    expected = sum(prior.logpdf(params[0, i]) for i, prior in enumerate(priors))
+    expected += np.sum(stats.norm.logpdf(residuals, scale=params[0, 6]))
+    np.testing.assert_allclose(lp[0], expected)
+    assert lp[1] == -np.inf
+    with pytest.raises(ValueError):
+        HymodLogPosterior(sample_data, priors[:5])
+
+def test_predictive_quantiles(sample_data):
+    """Test streamed quantiles agree with quantiles of the materialized ensemble."""
+    from msdbook.hymod import hymod_ensemble
+
+    rng = np.random.default_rng(5)
+    params = np.column_stack([
+        rng.uniform(0.1, 1, 400), rng.uniform(0, 0.1, 400), rng.uniform(0, 1, 400),
+        rng.uniform(5, 50, 400), rng.uniform(0.1, 1.9, 400),
+    ])
+    q = predictive_quantiles(params, sample_data, noise=False, batch_size=64, n_bins=5000)
+    Q = hymod_ensemble(params, sample_data, outputs=["Q"])["Q"]
+    expected = np.quantile(Q, [0.05, 0.5, 0.95], axis=1, method="inverted_cdf")
+    assert q.shape == (3, 20)
+    np.testing.assert_allclose(q, expected, rtol=0.01)
+
+def test_log_histogram_quantiles_skip_nan():
+    """Test NaN samples are left out of the quantiles rather than counted as zeros."""
+    values = np.array([[1.0, 2.0, 3.0, np.nan, np.nan], [np.nan] * 5])
+    estimator = _LogHistogramQuantiles(2, 0.1, 10, 10000)
+    estimator.update(values)
+    q = estimator.quantiles([0.1, 0.5])
+    np.testing.assert_allclose(q[:, 0], [1.0, 2.0], rtol=1e-3)
+    assert np.all(np.isnan(q[:, 1]))
+
+def test_prior_predictive_quantiles(sample_data, priors):
+    """Test prior-predictive quantiles are ordered and reproducible for a fixed seed."""
+    q = prior_predictive_quantiles(priors, sample_data, 250, batch_size=50, seed=3)
+    assert q.shape == (3, 20)
+    assert np.all(q[0] <= q[1]) and np.all(q[1] <= q[2])
+    np.testing.assert_array_equal(
+        q, prior_predictive_quantiles(priors, sample_data, 250, batch_size=50, seed=3)
+    )
+    with pytest.raises(ValueError):
+        prior_predictive_quantiles(priors[:5], sample_data, 10)
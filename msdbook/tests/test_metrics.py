@@ -0,0 +1,83 @@
+import pytest
+import numpy as np
+
+from msdbook.metrics import (
+    mse,
+    nse,
+    kge,
+    mae,
+    rmse,
+    log_nse,
+    bias,
+    peak_error,
+    skill_metrics,
+    skill_metrics_by_window,
+)
+
+
+@pytest.fixture
+def sample_flows():
+    """Fixture for observed and simulated flows."""
+    rng = np.random.default_rng(0)
+    obs = rng.random(50) + 0.5
+    sim = obs[:, None] + rng.normal(0, 0.1, (50, 4))
+    return sim, obs
+
+def test_mse(sample_flows):
+    sim, obs = sample_flows
+    expected = [np.mean((sim[:, i] - obs) ** 2) for i in range(4)]
+    np.testing.assert_allclose(mse(sim, obs), expected)
+
+def test_nse(sample_flows):
+    sim, obs = sample_flows
+    expected = [1 - np.sum((sim[:, i] - obs) ** 2) / np.sum((obs - obs.mean()) ** 2) for i in range(4)]
+    np.testing.assert_allclose(nse(sim, obs), expected)
+    np.testing.assert_allclose(nse(obs, obs), [1.0])
+
+def test_kge(sample_flows):
+    sim, obs = sample_flows
+    r = np.corrcoef(sim[:, 0], obs)[0, 1]
+    expected = 1 - np.sqrt(
+        (r - 1) ** 2 + (sim[:, 0].std() / obs.std() - 1) ** 2 + (sim[:, 0].mean() / obs.mean() - 1) ** 2
+    )
+    np.testing.assert_allclose(kge(sim, obs)[0], expected)
+    np.testing.assert_allclose(kge(obs, obs), [1.0])
+
+def test_shape_mismatch(sample_flows):
+    sim, obs = sample_flows
+    with pytest.raises(ValueError):
+        nse(sim[:10], obs)
+
+def test_mae_rmse_bias_peak(sample_flows):
+    sim, obs = sample_flows
+    np.testing.assert_allclose(mae(sim, obs), np.mean(np.abs(sim - obs[:, None]), axis=0))
+    np.testing.assert_allclose(rmse(sim, obs), np.sqrt(mse(sim, obs)))
+    np.testing.assert_allclose(bias(sim, obs), sim.mean(axis=0) - obs.mean())
+    np.testing.assert_allclose(peak_error(sim, obs), (sim.max(axis=0) - obs.max()) / obs.max())
+
+def test_log_nse(sample_flows):
+    sim, obs = sample_flows
+    eps = obs.mean() / 100
+    np.testing.assert_allclose(log_nse(sim, obs), nse(np.log(sim + eps), np.log(obs + eps)))
+
+def test_skill_metrics_chunked(sample_flows):
+    sim, obs = sample_flows
+    full = skill_metrics(sim, obs)
+    chunked = skill_metrics(sim, obs, chunk_size=3)
+    blocks = skill_metrics((sim[:, i : i + 2] for i in range(0, 4, 2)), obs, metrics=["nse"])
+    assert set(full) == {"mae", "mse", "rmse", "nse", "kge", "log_nse", "bias", "peak_error"}
+    for name in full:
+        assert full[name].shape == (4,)
+        np.testing.assert_allclose(chunked[name], full[name])
+    np.testing.assert_allclose(blocks["nse"], full["nse"])
+    with pytest.raises(ValueError):
+        skill_metrics(sim, obs, metrics=["r2"])
+
+def test_skill_metrics_by_window(sample_flows):
+    sim, obs = sample_flows
+    labels = np.repeat([2001, 2000], 25)
+    windows, scores = skill_metrics_by_window(sim, obs, labels, metrics=["mse", "kge"], chunk_size=3)
+    np.testing.assert_array_equal(windows, [2000, 2001])
+    assert scores["mse"].shape == (2, 4)
+    np.testing.assert_allclose(scores["mse"][0], mse(sim[25:], obs[25:]))
+    np.testing.assert_allclose(scores["kge"][1], kge(sim[:25], obs[:25]))
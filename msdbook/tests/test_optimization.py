@@ -0,0 +1,84 @@
+import pytest
+import numpy as np
+
+from msdbook.optimization import EpsilonArchive, epsilon_moea, FishGameProblem
+
+
+def zdt1(vars):
+    """Two-objective ZDT1 test problem, whose Pareto front is f2 = 1 - sqrt(f1) at g = 1."""
+    g = 1 + 9 * vars[:, 1:].mean(axis=1)
+    f1 = vars[:, 0]
+    return np.column_stack([f1, g * (1 - np.sqrt(f1 / g))])
+
+def constrained(vars):
+    """ZDT1 with the constraint f1 >= 0.5."""
+    objs = zdt1(vars)
+    return objs, 0.5 - objs[:, :1]
+
+def test_epsilon_archive():
+    archive = EpsilonArchive([0.1, 0.1])
+    assert archive.add([0], [0.55, 0.55])
+    assert not archive.add([1], [0.58, 0.58])  # same box, farther from its corner
+    assert archive.add([2], [0.51, 0.52])  # same box, closer to its corner
+    assert archive.add([3], [0.25, 0.85])  # nondominated box
+    assert not archive.add([4], [0.65, 0.75])  # dominated box
+    assert archive.add([5], [0.15, 0.15])  # dominates every other box
+    np.testing.assert_array_equal(archive.vars, [[5]])
+    np.testing.assert_array_equal(archive.objs, [[0.15, 0.15]])
+
+def test_epsilon_moea_zdt1():
+    """Test the archive approaches the ZDT1 front and keeps one solution per epsilon box."""
+    bounds = [[0, 1]] * 5
+    result = epsilon_moea(zdt1, bounds, [0.05, 0.05], 3000, population_size=20, batch_size=10,
+                          processes=1, seed=1)
+    assert result["nfe"] == 3000
+    f1, f2 = result["objs"].T
+    assert len(f1) >= 5
+    assert np.all(f2 - (1 - np.sqrt(f1)) < 0.2)
+    boxes = np.floor(result["objs"] / 0.05)
+    assert len(np.unique(boxes, axis=0)) == len(boxes)
+
+def test_epsilon_moea_constraints():
+    """Test only feasible solutions enter the archive."""
+    result = epsilon_moea(constrained, [[0, 1]] * 3, [0.05, 0.05], 400, population_size=20,
+                          processes=1, seed=2)
+    assert len(result["objs"]) > 0
+    assert np.all(result["objs"][:, 0] >= 0.5)
+
+def test_epsilon_moea_more_workers_than_batch():
+    """Test a constrained run with more worker processes than candidates per batch."""
+    kwargs = dict(bounds=[[0, 1]] * 3, epsilons=[0.05, 0.05], n_evals=23, population_size=6,
+                  batch_size=3, seed=0)
+    pooled = epsilon_moea(constrained, processes=4, **kwargs)
+    serial = epsilon_moea(constrained, processes=1, **kwargs)
+    assert pooled["nfe"] == 23
+    np.testing.assert_array_equal(pooled["objs"], serial["objs"])
+
+def test_epsilon_moea_islands_and_restart(tmp_path):
+    """Test islands give the same result in parallel and when resumed from a snapshot."""
+    kwargs = dict(bounds=[[0, 1]] * 4, epsilons=[0.05, 0.05], population_size=10, batch_size=5,
+                  n_islands=2, migration_interval=20, seed=3)
+    full = epsilon_moea(zdt1, n_evals=180, processes=1, **kwargs)
+    pooled = epsilon_moea(zdt1, n_evals=180, processes=2, **kwargs)
+    np.testing.assert_array_equal(full["objs"], pooled["objs"])
+
+    path = str(tmp_path / "moea.npz")
+    epsilon_moea(zdt1, n_evals=100, processes=1, snapshot=path, **kwargs)
+    resumed = epsilon_moea(zdt1, n_evals=180, processes=1, snapshot=path, **kwargs)
+    assert resumed["nfe"] == 180
+    np.testing.assert_array_equal(resumed["vars"], full["vars"])
+    with pytest.raises(ValueError):
+        epsilon_moea(zdt1, n_evals=200, processes=1, snapshot=path,
+                     **dict(kwargs, population_size=8))
+
+def test_fish_game_problem():
+    """Test the fish game evaluator is deterministic and feeds the optimizer."""
+    problem = FishGameProblem(N=5, tSteps=20)
+    vars = np.random.default_rng(0).random((3, 6))
+    objs, cnstr = problem(vars)
+    assert objs.shape == (3, 5)
+    assert cnstr.shape == (3, 1)
+    np.testing.assert_array_equal(problem(vars)[0], objs)
+    result = epsilon_moea(problem, problem.bounds, [50, 0.05, 5, 1, 50], 40, population_size=10,
+                          processes=1, seed=0)
+    assert result["vars"].shape[1] == 6
@@ -1,3 +1,5 @@
+import concurrent.futures
+import os
 import pytest
 from unittest import mock
 import numpy as np
@@ -21,6 +23,16 @@ mock_hymod_monthly_simulations = (np.array([0.1, 0.2]), np.array([0.3, 0.4]))
 mock_hymod_annual_simulations = (np.array([0.5, 0.6]), np.array([0.7, 0.8]))
 mock_hymod_varying_simulations = (np.array([0.9, 1.0]), np.array([1.1, 1.2]))
 
+# Keep the binary caches of every test out of the user's cache directory and the in-memory datasets
+# from leaking between tests
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("MSDBOOK_CACHE_DIR", str(tmp_path / "cache"))
+    package_data.clear_dataset_cache()
+    yield tmp_path / "cache"
+    package_data.clear_dataset_cache()
+
+
 # Test for the function get_data_directory
 @mock.patch("importlib.resources.files")
 def test_get_data_directory(mock_files):
@@ -137,6 +149,15 @@ def test_load_hymod_simulation(mock_read_csv):
     pd.testing.assert_frame_equal(result, mock_hymod_simulation)
 
 
+# Test for load_hymod_simulation with a reduced precision dtype
+@mock.patch("msdbook.package_data.pd.read_csv")
+def test_load_hymod_simulation_dtype(mock_read_csv):
+    mock_read_csv.side_effect = [pd.DataFrame(columns=["Kq", "Q1", "Q2"]), mock_hymod_simulation]
+    result = package_data.load_hymod_simulation(dtype=np.float32)
+    pd.testing.assert_frame_equal(result, mock_hymod_simulation)
+    assert mock_read_csv.call_args.kwargs["dtype"] == {"Q1": np.float32, "Q2": np.float32}
+
+
 # Test for load_hymod_monthly_simulations
 @mock.patch("msdbook.package_data.np.load")
 def test_load_hymod_monthly_simulations(mock_load):
@@ -172,3 +193,86 @@ def test_load_hymod_varying_simulations(mock_load):
     np.testing.assert_array_equal(result[0], mock_hymod_varying_simulations[0])
     np.testing.assert_array_equal(result[1], mock_hymod_varying_simulations[1])
 
+
+
+# Test the text loaders parse a file once and then reuse its binary cache
+def test_loadtxt_cache(tmp_path):
+    f = tmp_path / "values.csv"
+    f.write_text("1,2\n3,4\n")
+
+    with mock.patch("msdbook.package_data.np.loadtxt", wraps=np.loadtxt) as mock_loadtxt:
+        first = package_data._loadtxt(str(f), delimiter=",")
+        assert package_data._loadtxt(str(f), delimiter=",") is first
+        package_data.clear_dataset_cache()
+        cached = package_data._loadtxt(str(f), delimiter=",")
+        assert mock_loadtxt.call_count == 1
+
+        # touching the file keeps the cache, editing it rebuilds it
+        os.utime(f, ns=(0, 10**18))
+        np.testing.assert_array_equal(package_data._loadtxt(str(f), delimiter=","), [[1, 2], [3, 4]])
+        assert mock_loadtxt.call_count == 1
+        f.write_text("5,6\n")
+        np.testing.assert_array_equal(package_data._loadtxt(str(f), delimiter=","), [5, 6])
+        assert mock_loadtxt.call_count == 2
+
+    assert isinstance(cached, np.memmap)
+    assert not cached.flags.writeable
+    np.testing.assert_array_equal(cached, [[1, 2], [3, 4]])
+
+
+# Test the CSV loader returns a new frame each call from the cached records
+def test_read_csv_cache(tmp_path):
+    f = tmp_path / "table.csv"
+    f.write_text("Kq,Q1\n0.5,1.5\n0.25,2.5\n")
+
+    first = package_data._read_csv(str(f), dtype={"Q1": np.float32})
+    first["Q1"] = 0
+    package_data.clear_dataset_cache()
+    with mock.patch("msdbook.package_data.pd.read_csv") as mock_read_csv:
+        result = package_data._read_csv(str(f), dtype={"Q1": np.float32})
+    mock_read_csv.assert_not_called()
+    expected = pd.DataFrame({"Kq": [0.5, 0.25], "Q1": np.array([1.5, 2.5], dtype=np.float32)})
+    pd.testing.assert_frame_equal(result, expected)
+
+
+# Test the .npy loaders memory-map their arrays on request
+@mock.patch("msdbook.package_data.np.load")
+def test_npy_loaders_mmap_mode(mock_load):
+    mock_load.return_value = mock_hymod_params
+    package_data.load_hymod_params(mmap_mode="r")
+    package_data.load_user_heatmap_array("user", mmap_mode="r")
+    package_data.load_hymod_monthly_simulations(mmap_mode="r")
+    package_data.load_hymod_annual_simulations(mmap_mode="r")
+    package_data.load_hymod_varying_simulations(mmap_mode="r")
+    assert mock_load.call_count == 8
+    assert all(call.kwargs["mmap_mode"] == "r" for call in mock_load.call_args_list)
+
+
+# Test concurrent first loads from several processes each get the full array
+def test_loadtxt_cache_concurrent(tmp_path):
+    values = np.arange(20000.0).reshape(-1, 4)
+    f = tmp_path / "values.txt"
+    np.savetxt(f, values)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(package_data._loadtxt, [str(f)] * 8))
+
+    for result in results:
+        np.testing.assert_array_equal(result, values)
+    assert sorted(p.suffix for p in (tmp_path / "cache").iterdir()) == [".json", ".npy"]
+
+
+# Test a mocked parse of an existing data file is cached in the test's directory only
+@mock.patch("msdbook.package_data.np.loadtxt")
+@mock.patch("importlib.resources.files")
+def test_mocked_parse_stays_out_of_default_cache(
+    mock_files, mock_loadtxt, tmp_path, monkeypatch, isolated_cache
+):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "Robustness.txt").write_text("4 5 6\n")
+    mock_files.return_value = tmp_path
+    mock_loadtxt.return_value = mock_robustness_data
+    np.testing.assert_array_equal(package_data.load_robustness_data(), mock_robustness_data)
+    assert not (tmp_path / "home" / ".cache" / "msdbook").exists()
+    assert len(list(isolated_cache.glob("Robustness.txt.*.npy"))) == 1
@@ -0,0 +1,80 @@
+from unittest import mock
+
+import pytest
+import numpy as np
+
+from msdbook import robustness
+from msdbook.robustness import (
+    EvaluationCache,
+    reevaluate_policies,
+    satisficing,
+    regret,
+    robustness_analysis,
+)
+
+
+@pytest.fixture
+def policies():
+    """Fixture for three RBF harvest policies."""
+    return np.random.default_rng(0).random((3, 6))
+
+@pytest.fixture
+def sows():
+    """Fixture for four states of the world around the baseline parameters."""
+    rng = np.random.default_rng(1)
+    base = np.array([0.005, 0.5, 0.5, 0.1, 0.1, 2000, 0.7, 0.004, 0.004])
+    return base * rng.uniform(0.5, 1.5, (4, 9))
+
+def test_reevaluate_policies_cache(policies, sows, tmp_path):
+    """Test cached cells are reused and only new policies and SOWs are simulated."""
+    kwargs = dict(N=5, tSteps=20, processes=1)
+    expected = reevaluate_policies(policies, sows, **kwargs)
+    assert expected.shape == (3, 4, 6)
+
+    wrapped = mock.patch.object(robustness, "fish_game_batch", wraps=robustness.fish_game_batch)
+    with wrapped as batch:
+        first = reevaluate_policies(policies[:2], sows[:3], cache=tmp_path, **kwargs)
+        np.testing.assert_array_equal(first, expected[:2, :3])
+        assert batch.call_count == 1
+
+        full = reevaluate_policies(policies, sows, cache=tmp_path, **kwargs)
+        np.testing.assert_array_equal(full, expected)
+        # one call for the new SOW of the cached policies and one for the new policy
+        assert batch.call_count == 3
+        assert batch.call_args_list[1].args[1].shape == (1, 9)
+
+        reevaluate_policies(policies, sows, cache=tmp_path, **kwargs)
+        assert batch.call_count == 3
+
+def test_evaluation_cache_shared(tmp_path):
+    """Test two caches writing the same policy's cells to one directory keep each other's cells."""
+    policy = np.arange(6.0)
+    first = EvaluationCache(tmp_path, N=5)
+    second = EvaluationCache(tmp_path, N=5)
+    assert not first.lookup(policy, ["a", "b", "c"], 2)[1].any()
+    first.store(policy, ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    second.store(policy, ["c"], [[5.0, 6.0]])
+    values, found = EvaluationCache(tmp_path, N=5).lookup(policy, ["c", "a", "d"], 2)
+    np.testing.assert_array_equal(found, [True, True, False])
+    np.testing.assert_array_equal(values[:2], [[5.0, 6.0], [1.0, 2.0]])
+    assert not EvaluationCache(tmp_path, N=6).lookup(policy, ["a"], 2)[1].any()
+
+def test_satisficing_and_regret():
+    performance = np.array([
+        [[1.0, 0.0], [2.0, 1.0], [3.0, 0.0]],
+        [[2.0, 0.0], [1.0, 0.0], [1.0, 2.0]],
+    ])
+    np.testing.assert_allclose(satisficing(performance, {0: 2.0, 1: 0}), [1 / 3, 2 / 3])
+    np.testing.assert_allclose(regret(performance, percentile=100), [[2.0, 1.0], [1.0, 2.0]])
+    np.testing.assert_allclose(
+        regret(performance, baseline=np.array([[1.0, 0.0], [1.0, 0.0]]), percentile=50),
+        [[1.0, 0.0], [0.0, 0.0]],
+    )
+
+def test_robustness_analysis(policies, sows):
+    result = robustness_analysis(policies, sows, {"collapse_days": 0}, baseline_sow=sows[0],
+                                 N=5, tSteps=20, processes=1)
+    assert result["performance"].shape == (3, 4, 6)
+    assert result["satisficing"].shape == (3,)
+    assert np.all((result["satisficing"] >= 0) & (result["satisficing"] <= 1))
+    np.testing.assert_array_equal(result["regret"].shape, (3, 6))
@@ -2,7 +2,7 @@ import pytest
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from msdbook.utils import fit_logit, plot_contour_map
+from msdbook.utils import fit_logit, plot_contour_map, atomic_path, atomic_savez
 from statsmodels.base.wrapper import ResultsWrapper
 import warnings
 from statsmodels.tools.sm_exceptions import HessianInversionWarning
@@ -180,3 +180,18 @@ def test_fit_logit_comprehensive(sample_data):
     # Check if any coefficient has a p-value less than 0.1 (10% significance level)
     assert np.any(result.pvalues < 0.1)
     
+
+def test_atomic_savez(tmp_path):
+    """Test the file is replaced whole and no temporary file is left behind, even on failure."""
+    path = tmp_path / "state.npz"
+    atomic_savez(path, a=np.arange(3))
+    atomic_savez(path, a=np.arange(5))
+    with np.load(path) as data:
+        np.testing.assert_array_equal(data["a"], np.arange(5))
+    with pytest.raises(RuntimeError):
+        with atomic_path(path, ".npz") as tmp:
+            np.savez(tmp, a=np.zeros(2))
+            raise RuntimeError("interrupted")
+    with np.load(path) as data:
+        np.testing.assert_array_equal(data["a"], np.arange(5))
+    assert [p.name for p in tmp_path.iterdir()] == ["state.npz"]
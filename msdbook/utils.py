@@ -1,3 +1,6 @@
+import contextlib
+import os
+import uuid
 import warnings
 
 import numpy as np
@@ -50,3 +53,33 @@ def plot_contour_map(
     ax.tick_params(axis="both", labelsize=12)
 
     return contourset
+
+
+@contextlib.contextmanager
+def atomic_path(path, suffix=""):
+    """Yield a temporary path to write in place of `path`, moved onto `path` on success.
+
+    The temporary file is unique to the writer and sits in the same directory, so concurrent
+    writers never share it and readers only ever see a complete file.  It is removed on failure.
+
+    :param path:            Destination path
+    :param suffix:          Suffix of the temporary path, e.g. '.npz' so numpy keeps the name as is
+
+    """
+
+    tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp{suffix}"
+
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+def atomic_savez(path, **arrays):
+    """Write arrays to an `.npz` file, replacing any previous file atomically."""
+
+    with atomic_path(path, ".npz") as tmp:
+        np.savez(tmp, **arrays)